@@ -11,9 +11,8 @@
 from flask import (Flask, render_template, request, redirect, url_for, flash,
                    jsonify, make_response, session as login_session)
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database_setup import Base, Category, Item, User
+from sqlalchemy.orm import joinedload, scoped_session, sessionmaker
+from database_setup import Base, Category, Item, User, engine
 
 from oauth2client.client import flow_from_clientsecrets, FlowExchangeError
 
@@ -29,18 +28,33 @@ app = Flask(__name__)
 CLIENT_ID = json.loads(open('client_secrets.json', 'r')
                        .read())['web']['client_id']
 
-# Connect to Database and create database session
-engine = create_engine('sqlite:///catalog.db')
+# Connect to Database (see database_setup.makeEngine). Each request gets
+# its own session from the registry, removed when the request ends
 Base.metadata.bind = engine
 DBSession = sessionmaker(bind=engine)
-session = DBSession()
+session = scoped_session(DBSession)
+
+
+@app.teardown_appcontext
+def removeSession(exception=None):
+    session.remove()
+
+
+def itemQuery(user=False):
+    # Query for items with their category (and creator if user is True)
+    # joined in, so pages listing items and building their urls make the
+    # same number of queries however many items there are
+    options = [joinedload(Item.category)]
+    if user:
+        options.append(joinedload(Item.user))
+    return session.query(Item).options(*options)
 
 
 @app.route('/')
 @app.route('/catalog/')
 def index():
     categories = session.query(Category)
-    items = session.query(Item).order_by(Item.id.desc()).limit(10)
+    items = itemQuery().order_by(Item.id.desc()).limit(10)
     dbinfo = {"categories": categories, "items": items, "current": ""}
     return render_template('index.html', dbinfo=dbinfo,)
 
@@ -48,7 +62,7 @@ def index():
 @app.route('/catalog/<category_name>/')
 def category(category_name):
     categories = session.query(Category)
-    items = session.query(Item).filter(Item.category.has(name=category_name))
+    items = itemQuery().filter(Item.category.has(name=category_name))
     dbinfo = {"categories": categories, "items": items,
               "current": category_name}
     return render_template('category.html', dbinfo=dbinfo)
@@ -60,17 +74,17 @@ def item(category_name, item_name, item_id):
 
     # Find first item with same name & category if id not supplied
     if item_id:
-        current = session.query(Item) \
+        current = itemQuery(user=True) \
          .filter(Item.id == item_id, Item.name == item_name,
                  Item.category.has(name=category_name)).one()
     else:
-        current = session.query(Item) \
+        current = itemQuery(user=True) \
          .filter(Item.name == item_name,
                  Item.category.has(name=category_name)) \
-         .order_by(id.desc()).first()
+         .order_by(Item.id.desc()).first()
     categories = session.query(Category)
-    items = session.query(Item).filter(Item.category.has(name=category_name))
-    creator = getUserInfo(current.user_id)
+    items = itemQuery().filter(Item.category.has(name=category_name))
+    creator = current.user
     dbinfo = {"categories": categories, "items": items, "current": current}
 
     # Determine template based on user login
@@ -97,7 +111,7 @@ def newItem():
                        user_id=login_session['user_id'])
         session.add(newitem)
         session.commit()
-        current = (session.query(Item)
+        current = (itemQuery()
                    .filter(Item.name == request.form['name'],
                    Item.user_id == login_session['user_id']).first())
         flash("new item has been created!")
@@ -117,7 +131,7 @@ def editItem(category_name, item_name, item_id):
     if 'username' not in login_session:
         return redirect('/login')
 
-    edititem = session.query(Item).filter_by(id=item_id).one()
+    edititem = itemQuery().filter_by(id=item_id).one()
     if edititem.user_id != login_session['user_id']:
         return ("<script>function myFunction() {alert('You are not authorized "
                 "to edit this item. Please create your own item in order to "
@@ -134,12 +148,12 @@ def editItem(category_name, item_name, item_id):
         session.add(edititem)
         session.commit()
         flash("item has been edited!")
-        items = session.query(Item).filter_by(id=item_id).one()
+        items = itemQuery().filter_by(id=item_id).one()
         return redirect(url_for('item', category_name=items.category.name,
                                 item_name=items.name, item_id=items.id))
     else:
         categories = session.query(Category)
-        items = session.query(Item).filter_by(category_id=edititem.category_id)
+        items = itemQuery().filter_by(category_id=edititem.category_id)
         dbinfo = {"categories": categories, "items": items,
                   "current": edititem}
         return render_template('edititem.html', dbinfo=dbinfo)
@@ -150,7 +164,7 @@ def editItem(category_name, item_name, item_id):
 def deleteItem(category_name, item_name, item_id):
     if 'username' not in login_session:
         return redirect('/login')
-    deleteitem = session.query(Item).filter_by(id=item_id).one()
+    deleteitem = itemQuery(user=True).filter_by(id=item_id).one()
     if deleteitem.user_id != login_session['user_id']:
         return ("<script>function myFunction() {alert('You are not authorized "
                 "to delete this item. Please create your own item in order to "
@@ -163,8 +177,7 @@ def deleteItem(category_name, item_name, item_id):
         return redirect(url_for('category', category_name=current))
     else:
         categories = session.query(Category)
-        items = session.query(Item) \
-            .filter_by(category_id=deleteitem.category_id)
+        items = itemQuery().filter_by(category_id=deleteitem.category_id)
         dbinfo = {"categories": categories, "items": items,
                   "current": deleteitem}
         return render_template('deleteitem.html', dbinfo=dbinfo)
@@ -175,7 +188,7 @@ def userItems(user_id):
     if 'username' not in login_session:
         return redirect('/login')
     categories = session.query(Category)
-    items = session.query(Item).filter_by(user_id=user_id)
+    items = itemQuery().filter_by(user_id=user_id)
     dbinfo = {"categories": categories, "items": items, "current": ""}
     return render_template('useritems.html', dbinfo=dbinfo)
 
@@ -415,7 +428,7 @@ def catalogItemJSON(category_id, item_id):
 def catalog_feed():
     feed = AtomFeed('Recent Items',
                     feed_url=request.url, url=request.url_root)
-    items = session.query(Item).order_by(Item.id.desc()).limit(10).all()
+    items = itemQuery(user=True).order_by(Item.id.desc()).limit(10).all()
     for i in items:
         feed.add(i.name, unicode(i.description), content_type='html',
                  author=i.user.name,
@@ -455,4 +468,4 @@ def getUserInfo(user_id):
 if __name__ == '__main__':
     app.secret_key = '\xf9;\x14\x13\xad\xda\xa8bk\x94\xdaa'
     app.debug = True
-    app.run(host='0.0.0.0', port=8000)
+    app.run(host='0.0.0.0', port=8000, threaded=True)
@@ -8,12 +8,10 @@
 # Created:      12-1-2015
 # ------------------------------------------------------------------------------
 
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from database_setup import Base, Category, Item, User
+from database_setup import Base, Category, Item, User, engine
 
 # Connect to Database and create database session
-engine = create_engine('sqlite:///catalog.db')
 Base.metadata.bind = engine
 DBSession = sessionmaker(bind=engine)
 session = DBSession()
@@ -0,0 +1,67 @@
+# ------------------------------------------------------------------------------
+# Name:         catalog_loadtest
+# Purpose:      Measure how many requests a second the catalog serves to
+#               concurrent clients from a threaded server
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import sys
+import threading
+import time
+import urllib2
+from werkzeug.serving import make_server
+from application import app
+
+# Pages requested in turn by every client, all readable without logging in
+PATHS = ['/catalog/', '/catalog/Hockey/', '/catalog/JSON', '/catalog/ATOM']
+
+
+def loadTest(clients=(1, 4, 16, 32), requests=800, port=8001):
+    # Serves the app from a threaded server in the background and prints
+    # the requests per second reached by each number of concurrent clients,
+    # every client sharing the same total number of requests
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    serving = threading.Thread(target=server.serve_forever)
+    serving.daemon = True
+    serving.start()
+    base = 'http://127.0.0.1:%d' % port
+    print ("~~ CATALOG: %d requests over %s ~~" % (requests, ", ".join(PATHS)))
+    try:
+        for num_clients in clients:
+            rate, errors = measure(base, num_clients, requests)
+            print ("%3d clients: %8.1f requests/s  %d errors"
+                   % (num_clients, rate, errors))
+    finally:
+        server.shutdown()
+
+
+def measure(base, num_clients, requests):
+    # Returns (requests per second, failed requests) for num_clients
+    # threads sharing requests between them
+    errors = []
+
+    def client(count):
+        for n in range(count):
+            try:
+                urllib2.urlopen(base + PATHS[n % len(PATHS)]).read()
+            except Exception as e:
+                errors.append(e)
+    share = requests // num_clients
+    threads = [threading.Thread(target=client, args=(share,))
+               for n in range(num_clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return share * num_clients / (time.time() - start), len(errors)
+
+
+if __name__ == '__main__':
+
+    # Run "python catalog_loadtest.py [clients...]" after catalog_initialize.py
+    clients = tuple(int(arg) for arg in sys.argv[1:])
+    loadTest(clients or (1, 4, 16, 32))
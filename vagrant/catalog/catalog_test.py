@@ -0,0 +1,99 @@
+# ------------------------------------------------------------------------------
+# Name:         catalog_test
+# Purpose:      Check every catalog page renders in a fixed number of
+#               queries, however many items there are
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import os
+
+# Tests run on an empty in memory database, set before the app connects
+os.environ['CATALOG_DATABASE_URL'] = 'sqlite://'
+
+from contextlib import contextmanager
+from sqlalchemy import event
+from database_setup import engine
+from application import app, session, Category, Item, User
+
+app.secret_key = 'catalog test'
+client = app.test_client()
+
+# Pages checked by testFixedQueries, each with the number of queries it
+# should take. The user page is only shown once logged in
+PAGES = [('/catalog/', 2),
+         ('/catalog/Hockey/', 2),
+         ('/catalog/Hockey/Item 0.%d/', 3),
+         ('/catalog/user/%d/', 2),
+         ('/catalog/ATOM', 1)]
+
+
+@contextmanager
+def countQueries():
+    # Collects the statements sent to the database inside the block
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context, many):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def assertQueries(path, expected):
+    # Requests a page and raises an error unless it loads and takes
+    # exactly the expected number of queries
+    with countQueries() as statements:
+        response = client.get(path)
+    if response.status_code != 200:
+        raise ValueError("%s returned status %d" % (path,
+                                                    response.status_code))
+    if len(statements) != expected:
+        raise ValueError("%s took %d queries, expected %d:\n%s"
+                         % (path, len(statements), expected,
+                            "\n".join(statements)))
+
+
+def addItems(count):
+    # Adds count items spread over every category, each by a new user,
+    # returning the id of the first item and of its user
+    categories = session.query(Category).all()
+    users = [User(name="User %d" % n, email="user%d@catalog.test" % n)
+             for n in range(count)]
+    items = [Item(name="Item %d" % n, description="Test item",
+                  category=categories[n % len(categories)], user=users[n])
+             for n in range(count)]
+    session.add_all(items)
+    session.commit()
+    first = (items[0].id, users[0].id)
+    session.remove()
+    return first
+
+
+def testFixedQueries():
+    """Test to see if each page takes the same number of queries with 2
+       items as with 50"""
+    session.add_all([Category(name="Hockey"), Category(name="Golf")])
+    session.commit()
+    (item_id, user_id) = addItems(2)
+    with client.session_transaction() as login_session:
+        login_session['username'] = "User 0"
+        login_session['user_id'] = user_id
+    for count in (2, 50):
+        for (path, expected) in PAGES:
+            if '%d' in path:
+                path = path % (item_id if 'Item' in path else user_id)
+            assertQueries(path, expected)
+        if count == 2:
+            addItems(48)
+    print ("1. Every page takes the same number of queries for 2 or 50 "
+           "items.")
+
+
+if __name__ == '__main__':
+    testFixedQueries()
+    print ("Success!  All tests pass!")
@@ -2,6 +2,8 @@ apt-get -qqy update
 apt-get -qqy install postgresql python-psycopg2
 apt-get -qqy install python-flask python-sqlalchemy
 apt-get -qqy install python-pip
+apt-get -qqy install python3 python3-pip
+pip3 install psycopg2-binary
 pip install bleach
 pip install oauth2client
 pip install requests
@@ -0,0 +1,74 @@
+# ------------------------------------------------------------------------------
+# Name:         metrics
+# Purpose:      Collects the timings reported by tournament.py so slow calls,
+#               queries and pairing rounds can be found
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import logging
+import threading
+
+# Events reported by tournament.py to its metrics hook, each with a name and
+# a value:
+#   "call": public function name, seconds taken
+#   "query": SQL text (before arguments are filled in), seconds taken
+#   "checkout": "pool", seconds spent waiting for a pooled connection
+#   "connect": "open", seconds taken to open a new database connection
+#   "pairing": strategy name, seconds spent pairing a round
+#   "attempts": strategy name, pairings tried before one was accepted
+EVENTS = ("call", "query", "checkout", "connect", "pairing", "attempts")
+
+slow_log = logging.getLogger("tournament.slow_queries")
+
+
+class Metrics(object):
+    """Metrics hook keeping a count, total and maximum of every value
+    reported for each event and name. Safe to share between threads.
+
+    Example:
+        metrics = Metrics(slow_query=0.5)
+        setMetrics(metrics)
+        swissPairings(tourney_id)
+        print (metrics.top("query"))
+
+    Args:
+      slow_query: queries taking at least this many seconds are logged to
+                  the "tournament.slow_queries" logger. Default None logs
+                  nothing
+    """
+
+    def __init__(self, slow_query=None):
+        self.slow_query = slow_query
+        self.stats = dict((event, {}) for event in EVENTS)
+        self._lock = threading.Lock()
+
+    def __call__(self, event, name, value):
+        with self._lock:
+            totals = self.stats.setdefault(event, {}).get(name)
+            if totals is None:
+                self.stats[event][name] = {"count": 1, "total": value,
+                                           "max": value}
+            else:
+                totals["count"] += 1
+                totals["total"] += value
+                totals["max"] = max(totals["max"], value)
+        if (event == "query" and self.slow_query is not None and
+                value >= self.slow_query):
+            slow_log.warning("%.3fs: %s", value, " ".join(name.split()))
+
+    def top(self, event, limit=10):
+        """Returns up to limit (name, count, total, max) tuples of an
+        event, highest total first"""
+        with self._lock:
+            rows = [(name, totals["count"], totals["total"], totals["max"])
+                    for (name, totals) in self.stats.get(event, {}).items()]
+        rows.sort(key=lambda row: -row[2])
+        return rows[:limit]
+
+    def reset(self):
+        """Forgets everything collected so far"""
+        with self._lock:
+            self.stats = dict((event, {}) for event in EVENTS)
@@ -0,0 +1,46 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 001_standings_records
+-- Purpose: Move an existing tournament database to the Records table
+--          replacing the calculated Standings view
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Create table Records keeping running totals for each contestant
+CREATE TABLE Records (
+    tourney_id integer,
+    player_id integer,
+    matches integer NOT NULL DEFAULT 0,
+    wins integer NOT NULL DEFAULT 0,
+    loses integer NOT NULL DEFAULT 0,
+    ties integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (tourney_id, player_id),
+    FOREIGN KEY (tourney_id, player_id)
+        REFERENCES Contestants (tourney_id, player_id) ON DELETE CASCADE
+);
+
+-- Keep the old calculated view for checking Records against Matches
+ALTER VIEW Standings RENAME TO Computed_Standings;
+
+-- Fill Records from every match recorded so far
+INSERT INTO Records (tourney_id, player_id, matches, wins, loses, ties)
+    SELECT tourney_id, player_id, matches, wins, loses, ties
+    FROM Computed_Standings;
+
+-- Create view Standings to view player statistics from Records
+CREATE VIEW Standings AS
+    SELECT Records.tourney_id, Tourneys.name as tourney_name,
+           Records.player_id, Players.name, Records.matches,
+           Records.wins, Records.loses, Records.ties
+    FROM Records
+    JOIN Tourneys ON Records.tourney_id = Tourneys.id
+    JOIN Players ON Records.player_id = Players.id
+    ORDER BY Records.tourney_id, Records.player_id;
+
+COMMIT;
@@ -0,0 +1,33 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 002_pairings_index
+-- Purpose: Add the Pairings table used by swissPairings to check for
+--          rematches to an existing tournament database
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Create table Pairings indexing every pair of players who have met in a
+-- tournament, lower id first
+CREATE TABLE Pairings (
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    id_low integer REFERENCES Players (id) ON DELETE CASCADE,
+    id_high integer REFERENCES Players (id) ON DELETE CASCADE,
+    PRIMARY KEY (tourney_id, id_low, id_high),
+    CHECK (id_low < id_high)
+);
+
+-- Fill Pairings from every match recorded so far, byes have no opponent
+INSERT INTO Pairings (tourney_id, id_low, id_high)
+    SELECT DISTINCT tourney_id, LEAST(id_one, id_two), GREATEST(id_one, id_two)
+    FROM (SELECT tourney_id,
+          COALESCE(id_winner, id_tie_a) as id_one,
+          COALESCE(id_loser, id_tie_b) as id_two FROM Matches) as previous
+    WHERE id_one IS NOT NULL AND id_two IS NOT NULL;
+
+COMMIT;
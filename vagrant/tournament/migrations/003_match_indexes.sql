@@ -0,0 +1,32 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 003_match_indexes
+-- Purpose: Index Matches, Contestants and Records so standings, past
+--          pairings and byes for one tournament or player are found
+--          without scanning every match ever recorded
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- One index for each player column of Matches, tournament first, matching
+-- how Computed_Standings joins each column and how byes are looked up.
+-- Queries on tourney_id alone (Past_Pairings, deleteMatches) use any of them
+CREATE INDEX matches_winner_idx ON Matches (tourney_id, id_winner);
+CREATE INDEX matches_loser_idx ON Matches (tourney_id, id_loser);
+CREATE INDEX matches_tie_a_idx ON Matches (tourney_id, id_tie_a);
+CREATE INDEX matches_tie_b_idx ON Matches (tourney_id, id_tie_b);
+
+-- Player lookups across tournaments (playerStandings, deleting players)
+CREATE INDEX contestants_player_idx ON Contestants (player_id);
+CREATE INDEX records_player_idx ON Records (player_id);
+
+ANALYZE Matches;
+ANALYZE Contestants;
+ANALYZE Records;
+
+COMMIT;
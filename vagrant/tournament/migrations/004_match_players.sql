@@ -0,0 +1,92 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 004_match_players
+-- Purpose: Move the players of each match from the four nullable columns
+--          of Matches (id_winner, id_loser, id_tie_a, id_tie_b) to the
+--          Match_Players table, one row per player in a match
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Give every match an id for Match_Players to reference
+ALTER TABLE Matches ADD COLUMN id serial PRIMARY KEY;
+
+-- Create table Match_Players with one row for each player in a match
+CREATE TABLE Match_Players (
+    match_id integer REFERENCES Matches (id) ON DELETE CASCADE,
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    player_id integer REFERENCES Players (id) ON DELETE RESTRICT,
+    outcome text NOT NULL CHECK (outcome IN ('win', 'loss', 'tie', 'bye')),
+    PRIMARY KEY (match_id, player_id)
+);
+
+-- Copy every player of every match, a win against no one is a bye
+INSERT INTO Match_Players (match_id, tourney_id, player_id, outcome)
+    SELECT id, tourney_id, id_winner,
+           CASE WHEN id_loser IS NULL THEN 'bye' ELSE 'win' END
+    FROM Matches WHERE id_winner IS NOT NULL
+    UNION ALL
+    SELECT id, tourney_id, id_loser, 'loss'
+    FROM Matches WHERE id_loser IS NOT NULL
+    UNION ALL
+    SELECT id, tourney_id, id_tie_a, 'tie'
+    FROM Matches WHERE id_tie_a IS NOT NULL
+    UNION ALL
+    SELECT id, tourney_id, id_tie_b, 'tie'
+    FROM Matches WHERE id_tie_b IS NOT NULL;
+
+-- Views reading the old columns are replaced below, dropping the columns
+-- also drops the indexes added by 003_match_indexes.sql
+DROP VIEW Past_Pairings;
+DROP VIEW Computed_Standings;
+ALTER TABLE Matches DROP COLUMN id_winner, DROP COLUMN id_loser,
+                    DROP COLUMN id_tie_a, DROP COLUMN id_tie_b;
+
+CREATE INDEX matches_tourney_idx ON Matches (tourney_id);
+CREATE INDEX match_players_contestant_idx
+    ON Match_Players (tourney_id, player_id);
+CREATE INDEX match_players_player_idx ON Match_Players (player_id);
+CREATE INDEX match_players_bye_idx ON Match_Players (tourney_id)
+    WHERE outcome = 'bye';
+
+-- Create view Past_Pairings to view all previous matchups, the winner
+-- (or lower id of a tie) first
+CREATE VIEW Past_Pairings AS
+    SELECT one.tourney_id, one.player_id as id_one, pa.name as name_one,
+           two.player_id as id_two, pb.name as name_two
+    FROM Match_Players AS one
+    JOIN Match_Players AS two ON one.tourney_id = two.tourney_id
+    AND one.match_id = two.match_id AND one.player_id != two.player_id
+    AND (one.outcome = 'win'
+         OR (one.outcome = 'tie' AND one.player_id < two.player_id))
+    JOIN Players AS pa ON one.player_id = pa.id
+    JOIN Players AS pb ON two.player_id = pb.id;
+
+-- Create view Computed_Standings counting each contestant's outcomes in
+-- one grouped aggregate
+CREATE VIEW Computed_Standings AS
+    SELECT Contestants.tourney_id, Tourneys.name as tourney_name,
+           Contestants.player_id, Players.name,
+           COUNT(Match_Players.match_id) as matches,
+           COUNT(*) FILTER (WHERE outcome IN ('win', 'bye')) as wins,
+           COUNT(*) FILTER (WHERE outcome = 'loss') as loses,
+           COUNT(*) FILTER (WHERE outcome = 'tie') as ties
+    FROM Contestants
+    JOIN Tourneys ON Contestants.tourney_id = Tourneys.id
+    JOIN Players ON Contestants.player_id = Players.id
+    LEFT JOIN Match_Players
+    ON Contestants.tourney_id = Match_Players.tourney_id
+    AND Contestants.player_id = Match_Players.player_id
+    GROUP BY Contestants.tourney_id, Tourneys.name, Contestants.player_id,
+             Players.name
+    ORDER BY Contestants.tourney_id, Contestants.player_id;
+
+ANALYZE Matches;
+ANALYZE Match_Players;
+
+COMMIT;
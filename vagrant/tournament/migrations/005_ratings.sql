@@ -0,0 +1,25 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 005_ratings
+-- Purpose: Add the Ratings table holding each player's Elo rating for the
+--          leaderboard. Run "python tournament.py rebuild" afterwards to
+--          rate every match already recorded
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Create table Ratings keeping each player's Elo rating across every
+-- tournament, the index lets the leaderboard read only the top rows
+CREATE TABLE Ratings (
+    player_id integer PRIMARY KEY REFERENCES Players (id) ON DELETE CASCADE,
+    rating double precision NOT NULL,
+    matches integer NOT NULL DEFAULT 0
+);
+CREATE INDEX ratings_leaderboard_idx ON Ratings (rating DESC, player_id);
+
+COMMIT;
@@ -0,0 +1,39 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 006_archive
+-- Purpose: Add the Archived_Standings and Archived_Matches tables that
+--          purgeTournaments moves old tournaments into
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Create tables keeping the final standings and every match outcome of
+-- purged tournaments. Names are copied in and there are no foreign keys,
+-- so archived rows outlive the players and tournaments they describe
+CREATE TABLE Archived_Standings (
+    tourney_id integer,
+    tourney_name text,
+    player_id integer,
+    name text,
+    matches integer NOT NULL,
+    wins integer NOT NULL,
+    loses integer NOT NULL,
+    ties integer NOT NULL,
+    archived timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (tourney_id, player_id)
+);
+CREATE TABLE Archived_Matches (
+    match_id integer,
+    tourney_id integer,
+    player_id integer,
+    outcome text NOT NULL,
+    PRIMARY KEY (match_id, player_id)
+);
+CREATE INDEX archived_matches_tourney_idx ON Archived_Matches (tourney_id);
+
+COMMIT;
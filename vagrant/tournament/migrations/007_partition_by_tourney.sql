@@ -0,0 +1,226 @@
+-- ----------------------------------------------------------------------------
+-- 
+-- Name: 007_partition_by_tourney
+-- Purpose: Optional. Partition every table recorded per tournament
+--          (Contestants, Records, Matches, Match_Players and Pairings) by
+--          ranges of tourney_id, so queries about one tournament only read
+--          its range and whole ranges of old tournaments can be dropped.
+--          Needs PostgreSQL 12 or newer
+-- 
+-- Author: Jordan Alexander Watt
+-- 
+-- Created: 18-10-2026
+-- 
+-- ----------------------------------------------------------------------------
+
+BEGIN;
+
+-- Number of tournament ids in each partition. Change before running this
+-- migration, existing partitions keep the width they were created with
+CREATE FUNCTION tourney_partition_width() RETURNS integer
+    LANGUAGE sql IMMUTABLE AS 'SELECT 1000';
+
+-- Creates the partitions of every table for the range of tourney ids
+-- containing a tournament, unless they already exist. Called for each new
+-- tournament by the trigger on Tourneys below
+CREATE FUNCTION create_tourney_partitions(tourney integer) RETURNS void
+    LANGUAGE plpgsql AS $$
+DECLARE
+    low integer := (tourney / tourney_partition_width()) *
+                   tourney_partition_width();
+    parent text;
+BEGIN
+    IF to_regclass('matches_' || low) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    -- Two sessions creating the first tournament of a range wait for
+    -- each other here rather than both creating the partitions
+    PERFORM pg_advisory_xact_lock(hashtext('tourney_partitions'), low);
+    FOREACH parent IN ARRAY ARRAY['contestants', 'records', 'matches',
+                                  'match_players', 'pairings'] LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I '
+                       'FOR VALUES FROM (%s) TO (%s)', parent || '_' || low,
+                       parent, low, low + tourney_partition_width());
+    END LOOP;
+END;
+$$;
+
+CREATE FUNCTION create_tourney_partitions_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM create_tourney_partitions(NEW.id);
+    RETURN NULL;
+END;
+$$;
+
+-- Drops the partitions of every range of tourney ids whose tournaments are
+-- all in tourney_ids, tables referencing others first. Used by
+-- tournament.py to remove whole ranges without deleting row by row.
+-- Returns the number of ranges dropped
+CREATE FUNCTION drop_tourney_partitions(tourney_ids integer[]) RETURNS integer
+    LANGUAGE plpgsql AS $$
+DECLARE
+    low integer;
+    parent text;
+    dropped integer := 0;
+BEGIN
+    FOR low IN SELECT DISTINCT (tourney / tourney_partition_width()) *
+                               tourney_partition_width()
+               FROM unnest(tourney_ids) AS tourney LOOP
+        CONTINUE WHEN to_regclass('matches_' || low) IS NULL;
+        CONTINUE WHEN EXISTS (
+            SELECT 1 FROM Tourneys
+            WHERE id >= low AND id < low + tourney_partition_width()
+            AND id <> ALL (tourney_ids));
+        FOREACH parent IN ARRAY ARRAY['pairings', 'match_players', 'matches',
+                                      'records', 'contestants'] LOOP
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent,
+                           parent || '_' || low);
+            EXECUTE format('DROP TABLE %I', parent || '_' || low);
+        END LOOP;
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$;
+
+-- Views are recreated below on the partitioned tables
+DROP VIEW Standings;
+DROP VIEW Computed_Standings;
+DROP VIEW Past_Pairings;
+
+-- Move the current tables and their indexes out of the way. The matches id
+-- sequence is kept for the new Matches table
+ALTER SEQUENCE matches_id_seq OWNED BY NONE;
+ALTER TABLE Contestants RENAME TO Contestants_Old;
+ALTER TABLE Records RENAME TO Records_Old;
+ALTER TABLE Matches RENAME TO Matches_Old;
+ALTER TABLE Match_Players RENAME TO Match_Players_Old;
+ALTER TABLE Pairings RENAME TO Pairings_Old;
+ALTER INDEX contestants_tourney_id_player_id_key
+    RENAME TO contestants_old_key;
+ALTER INDEX records_pkey RENAME TO records_old_pkey;
+ALTER INDEX matches_pkey RENAME TO matches_old_pkey;
+ALTER INDEX match_players_pkey RENAME TO match_players_old_pkey;
+ALTER INDEX pairings_pkey RENAME TO pairings_old_pkey;
+ALTER INDEX contestants_player_idx RENAME TO contestants_old_player_idx;
+ALTER INDEX records_player_idx RENAME TO records_old_player_idx;
+ALTER INDEX matches_tourney_idx RENAME TO matches_old_tourney_idx;
+ALTER INDEX match_players_contestant_idx
+    RENAME TO match_players_old_contestant_idx;
+ALTER INDEX match_players_player_idx RENAME TO match_players_old_player_idx;
+ALTER INDEX match_players_bye_idx RENAME TO match_players_old_bye_idx;
+
+-- Create the partitioned tables as in tournament.sql. Every unique key
+-- includes tourney_id, so matches are referenced by (tourney_id, id)
+CREATE TABLE Contestants (
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    player_id integer REFERENCES Players (id) ON DELETE CASCADE,
+    UNIQUE (tourney_id, player_id)
+) PARTITION BY RANGE (tourney_id);
+CREATE INDEX contestants_player_idx ON Contestants (player_id);
+
+CREATE TABLE Records (
+    tourney_id integer,
+    player_id integer,
+    matches integer NOT NULL DEFAULT 0,
+    wins integer NOT NULL DEFAULT 0,
+    loses integer NOT NULL DEFAULT 0,
+    ties integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (tourney_id, player_id),
+    FOREIGN KEY (tourney_id, player_id)
+        REFERENCES Contestants (tourney_id, player_id) ON DELETE CASCADE
+) PARTITION BY RANGE (tourney_id);
+CREATE INDEX records_player_idx ON Records (player_id);
+
+CREATE TABLE Matches (
+    id integer NOT NULL DEFAULT nextval('matches_id_seq'),
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    PRIMARY KEY (tourney_id, id)
+) PARTITION BY RANGE (tourney_id);
+ALTER SEQUENCE matches_id_seq OWNED BY Matches.id;
+
+CREATE TABLE Match_Players (
+    match_id integer,
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    player_id integer REFERENCES Players (id) ON DELETE RESTRICT,
+    outcome text NOT NULL CHECK (outcome IN ('win', 'loss', 'tie', 'bye')),
+    PRIMARY KEY (tourney_id, match_id, player_id),
+    FOREIGN KEY (tourney_id, match_id)
+        REFERENCES Matches (tourney_id, id) ON DELETE CASCADE
+) PARTITION BY RANGE (tourney_id);
+CREATE INDEX match_players_contestant_idx
+    ON Match_Players (tourney_id, player_id);
+CREATE INDEX match_players_player_idx ON Match_Players (player_id);
+CREATE INDEX match_players_bye_idx ON Match_Players (tourney_id)
+    WHERE outcome = 'bye';
+
+CREATE TABLE Pairings (
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    id_low integer REFERENCES Players (id) ON DELETE CASCADE,
+    id_high integer REFERENCES Players (id) ON DELETE CASCADE,
+    PRIMARY KEY (tourney_id, id_low, id_high),
+    CHECK (id_low < id_high)
+) PARTITION BY RANGE (tourney_id);
+
+-- Partitions for every tournament so far, then for each new one
+SELECT create_tourney_partitions(id) FROM Tourneys;
+CREATE TRIGGER tourneys_partitions AFTER INSERT ON Tourneys
+    FOR EACH ROW EXECUTE FUNCTION create_tourney_partitions_trigger();
+
+-- Copy everything across, referenced tables first
+INSERT INTO Contestants SELECT tourney_id, player_id FROM Contestants_Old;
+INSERT INTO Records
+    SELECT tourney_id, player_id, matches, wins, loses, ties
+    FROM Records_Old;
+INSERT INTO Matches SELECT id, tourney_id FROM Matches_Old;
+INSERT INTO Match_Players
+    SELECT match_id, tourney_id, player_id, outcome FROM Match_Players_Old;
+INSERT INTO Pairings SELECT tourney_id, id_low, id_high FROM Pairings_Old;
+DROP TABLE Pairings_Old, Match_Players_Old, Matches_Old, Records_Old,
+           Contestants_Old;
+
+-- Create view Past_Pairings to view all previous matchups, the winner
+-- (or lower id of a tie) first
+CREATE VIEW Past_Pairings AS
+    SELECT one.tourney_id, one.player_id as id_one, pa.name as name_one,
+           two.player_id as id_two, pb.name as name_two
+    FROM Match_Players AS one
+    JOIN Match_Players AS two ON one.tourney_id = two.tourney_id
+    AND one.match_id = two.match_id AND one.player_id != two.player_id
+    AND (one.outcome = 'win'
+         OR (one.outcome = 'tie' AND one.player_id < two.player_id))
+    JOIN Players AS pa ON one.player_id = pa.id
+    JOIN Players AS pb ON two.player_id = pb.id;
+
+-- Create view Computed_Standings counting each contestant's outcomes in
+-- one grouped aggregate
+CREATE VIEW Computed_Standings AS
+    SELECT Contestants.tourney_id, Tourneys.name as tourney_name,
+           Contestants.player_id, Players.name,
+           COUNT(Match_Players.match_id) as matches,
+           COUNT(*) FILTER (WHERE outcome IN ('win', 'bye')) as wins,
+           COUNT(*) FILTER (WHERE outcome = 'loss') as loses,
+           COUNT(*) FILTER (WHERE outcome = 'tie') as ties
+    FROM Contestants
+    JOIN Tourneys ON Contestants.tourney_id = Tourneys.id
+    JOIN Players ON Contestants.player_id = Players.id
+    LEFT JOIN Match_Players
+    ON Contestants.tourney_id = Match_Players.tourney_id
+    AND Contestants.player_id = Match_Players.player_id
+    GROUP BY Contestants.tourney_id, Tourneys.name, Contestants.player_id,
+             Players.name
+    ORDER BY Contestants.tourney_id, Contestants.player_id;
+
+-- Create view Standings to view player statistics from Records
+CREATE VIEW Standings AS
+    SELECT Records.tourney_id, Tourneys.name as tourney_name,
+           Records.player_id, Players.name, Records.matches,
+           Records.wins, Records.loses, Records.ties
+    FROM Records
+    JOIN Tourneys ON Records.tourney_id = Tourneys.id
+    JOIN Players ON Records.player_id = Players.id
+    ORDER BY Records.tourney_id, Records.player_id;
+
+COMMIT;
@@ -0,0 +1,60 @@
+# ------------------------------------------------------------------------------
+# Name:         ratings
+# Purpose:      Elo ratings for ranking players across every tournament
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+# Every player starts on DEFAULT_RATING. K_FACTOR is the most a rating can
+# move in one match, PROVISIONAL_K is used instead for a player's first
+# PROVISIONAL_MATCHES matches so new players find their level quickly
+DEFAULT_RATING = 1500.0
+K_FACTOR = 24.0
+PROVISIONAL_K = 40.0
+PROVISIONAL_MATCHES = 20
+
+
+def expectedScore(rating, opponent_rating):
+    """Returns the score (0 to 1) a player is expected to take from a match
+    against an opponent, a win scoring 1 and a tie half"""
+    return 1.0 / (1.0 + 10.0 ** ((opponent_rating - rating) / 400.0))
+
+
+def updateRatings(ratings, results):
+    """Applies results to ratings in the order given. Byes (no loser) do not
+    change ratings as there is no opponent.
+
+    Args:
+      ratings: a dict of player id to (rating, matches), updated in place.
+               Players missing from it start on DEFAULT_RATING
+      results: an iterable of (winner, loser, tied) tuples as for
+               tournament.reportRound
+
+    Returns:
+      The set of ids of players whose rating changed
+    """
+    changed = set()
+    for (winner, loser, tied) in results:
+        if loser is None:
+            continue
+        (winner_rating, winner_matches) = ratings.get(winner,
+                                                      (DEFAULT_RATING, 0))
+        (loser_rating, loser_matches) = ratings.get(loser,
+                                                    (DEFAULT_RATING, 0))
+        expected = expectedScore(winner_rating, loser_rating)
+        score = 0.5 if tied else 1.0
+        ratings[winner] = (winner_rating + _kFactor(winner_matches) *
+                           (score - expected), winner_matches + 1)
+        ratings[loser] = (loser_rating + _kFactor(loser_matches) *
+                          (expected - score), loser_matches + 1)
+        changed.add(winner)
+        changed.add(loser)
+    return changed
+
+
+def _kFactor(matches):
+    """Returns the K factor of a player who has played a number of rated
+    matches"""
+    return PROVISIONAL_K if matches < PROVISIONAL_MATCHES else K_FACTOR
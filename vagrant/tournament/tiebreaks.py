@@ -0,0 +1,94 @@
+# ------------------------------------------------------------------------------
+# Name:         tiebreaks
+# Purpose:      Opponent based tiebreaks for ranking players on equal scores
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import numpy as np
+
+# A player's score counts a win (or bye) as 1 point and a tie as half
+POINTS = {'win': 1.0, 'bye': 1.0, 'tie': 0.5, 'loss': 0.0}
+
+# Opponents' match win percentage uses match points (3 for a win, 1 for a
+# tie) and treats anything under a third as a third, so opponents who
+# dropped out early do not count against a player too heavily
+MATCH_POINTS = {'win': 3.0, 'bye': 3.0, 'tie': 1.0, 'loss': 0.0}
+OMW_FLOOR = 1.0 / 3
+
+TIEBREAKS = ("buchholz", "median_buchholz", "sonneborn_berger", "omw")
+
+
+def computeTiebreaks(results):
+    """Computes the tiebreaks of every player in a tournament in one pass
+    over its results.
+
+    Byes add to a player's own score but not to their tiebreaks, as there
+    is no opponent. A player met twice is counted twice.
+
+    Args:
+      results: a list of tuples, one for each player in each match, each of
+               which contains (player_id, opponent_id, outcome):
+        player_id: the player's unique id
+        opponent_id: the unique id of their opponent, None for a bye
+        outcome: 'win', 'loss', 'tie' or 'bye' for the player
+
+    Returns:
+      A dict of player id to a tuple of
+      (buchholz, median_buchholz, sonneborn_berger, omw):
+        buchholz: the sum of the opponents' scores
+        median_buchholz: buchholz without the highest and lowest opponent
+                         scores, the same as buchholz under 3 opponents
+        sonneborn_berger: the scores of opponents beaten plus half the
+                          scores of opponents tied with
+        omw: the opponents' average match win percentage (0 to 1)
+    """
+    if not results:
+        return {}
+    (players, opponents, outcomes) = zip(*results)
+    ids, player = np.unique(np.array(players, dtype=np.int64),
+                            return_inverse=True)
+    count = len(ids)
+
+    # Opponents are found by their position in ids, byes are -1
+    opponent = np.array([-1 if opponent_id is None else opponent_id
+                         for opponent_id in opponents], dtype=np.int64)
+    faced = opponent >= 0
+    opponent[faced] = np.searchsorted(ids, opponent[faced])
+    outcome = np.array(outcomes)
+    points = np.zeros(len(outcome))
+    match_points = np.zeros(len(outcome))
+    for (name, value) in POINTS.items():
+        points[outcome == name] = value
+        match_points[outcome == name] = MATCH_POINTS[name]
+
+    # Totals of each player from every match they played
+    score = np.bincount(player, weights=points, minlength=count)
+    played = np.bincount(player, minlength=count)
+    win_rate = np.maximum(np.bincount(player, weights=match_points,
+                                      minlength=count) / (3.0 * played),
+                          OMW_FLOOR)
+
+    # Totals of each player from their opponents, byes left out
+    player = player[faced]
+    opponent = opponent[faced]
+    opponent_score = score[opponent]
+    num_opponents = np.bincount(player, minlength=count)
+    buchholz = np.bincount(player, weights=opponent_score, minlength=count)
+    sonneborn_berger = np.bincount(player,
+                                   weights=points[faced] * opponent_score,
+                                   minlength=count)
+    highest = np.zeros(count)
+    lowest = np.full(count, np.inf)
+    np.maximum.at(highest, player, opponent_score)
+    np.minimum.at(lowest, player, opponent_score)
+    lowest[num_opponents == 0] = 0.0
+    median_buchholz = np.where(num_opponents > 2,
+                               buchholz - highest - lowest, buchholz)
+    omw = (np.bincount(player, weights=win_rate[opponent], minlength=count) /
+           np.maximum(num_opponents, 1))
+    return dict(zip(ids.tolist(),
+                    zip(buchholz.tolist(), median_buchholz.tolist(),
+                        sonneborn_berger.tolist(), omw.tolist())))
@@ -35,74 +35,131 @@ CREATE TABLE Contestants (
     UNIQUE (tourney_id, player_id)
 );
 
--- Create table Matches referencing foreign id key in Players and Tourneys
+-- Create table Matches with one row for each match played
 CREATE TABLE Matches (
+    id serial PRIMARY KEY,
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE
+);
+CREATE INDEX matches_tourney_idx ON Matches (tourney_id);
+
+-- Create table Match_Players with one row for each player in a match and
+-- how the match went for them. A bye is a match with a single player whose
+-- outcome is 'bye' (counted as a win). tourney_id is copied from Matches so
+-- a contestant's matches are found without joining Matches
+CREATE TABLE Match_Players (
+    match_id integer REFERENCES Matches (id) ON DELETE CASCADE,
     tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
-    id_winner integer NULL DEFAULT NULL REFERENCES Players (id) ON DELETE RESTRICT,
-    id_loser integer NULL DEFAULT NULL REFERENCES Players (id) ON DELETE RESTRICT,
-    id_tie_a integer NULL DEFAULT NULL REFERENCES Players (id) ON DELETE RESTRICT,
-    id_tie_b integer NULL DEFAULT NULL REFERENCES Players (id) ON DELETE RESTRICT,
-    CHECK ((id_winner != id_loser) OR (id_winner != id_loser) IS NULL),
-    CHECK ((id_tie_a != id_tie_b) OR (id_tie_a != id_tie_b) IS NULL)
+    player_id integer REFERENCES Players (id) ON DELETE RESTRICT,
+    outcome text NOT NULL CHECK (outcome IN ('win', 'loss', 'tie', 'bye')),
+    PRIMARY KEY (match_id, player_id)
 );
+CREATE INDEX match_players_contestant_idx
+    ON Match_Players (tourney_id, player_id);
+CREATE INDEX match_players_player_idx ON Match_Players (player_id);
+CREATE INDEX match_players_bye_idx ON Match_Players (tourney_id)
+    WHERE outcome = 'bye';
+CREATE INDEX contestants_player_idx ON Contestants (player_id);
 
--- Create view Past_Pairings to view all previous matchups
+-- Create table Pairings indexing every pair of players who have met in a
+-- tournament. The lower id is always stored first so a matchup is found
+-- whichever player won. Rows are added by tournament.py with each match
+CREATE TABLE Pairings (
+    tourney_id integer REFERENCES Tourneys (id) ON DELETE CASCADE,
+    id_low integer REFERENCES Players (id) ON DELETE CASCADE,
+    id_high integer REFERENCES Players (id) ON DELETE CASCADE,
+    PRIMARY KEY (tourney_id, id_low, id_high),
+    CHECK (id_low < id_high)
+);
+
+-- Create view Past_Pairings to view all previous matchups, the winner
+-- (or lower id of a tie) first
 CREATE VIEW Past_Pairings AS
-    SELECT previous.tourney_id, previous.id_one, pa.name as name_one, 
-           previous.id_two, pb.name as name_two 
-    FROM (SELECT tourney_id, 
-          COALESCE(id_winner, id_tie_a) as id_one, 
-          COALESCE(id_loser, id_tie_b) as id_two FROM Matches) as previous 
-    JOIN Players AS pa ON previous.id_one = pa.id 
-    JOIN Players AS pb ON previous.id_two = pb.id;
-    
--- Create view Standings to view player statistics from matchups
-CREATE VIEW Standings AS
+    SELECT one.tourney_id, one.player_id as id_one, pa.name as name_one,
+           two.player_id as id_two, pb.name as name_two
+    FROM Match_Players AS one
+    JOIN Match_Players AS two ON one.tourney_id = two.tourney_id
+    AND one.match_id = two.match_id AND one.player_id != two.player_id
+    AND (one.outcome = 'win'
+         OR (one.outcome = 'tie' AND one.player_id < two.player_id))
+    JOIN Players AS pa ON one.player_id = pa.id
+    JOIN Players AS pb ON two.player_id = pb.id;
+
+-- Create table Records keeping running totals for each contestant. Rows are
+-- added when a player is registered and updated by tournament.py whenever a
+-- match is reported, so reading standings never has to scan Matches
+CREATE TABLE Records (
+    tourney_id integer,
+    player_id integer,
+    matches integer NOT NULL DEFAULT 0,
+    wins integer NOT NULL DEFAULT 0,
+    loses integer NOT NULL DEFAULT 0,
+    ties integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (tourney_id, player_id),
+    FOREIGN KEY (tourney_id, player_id)
+        REFERENCES Contestants (tourney_id, player_id) ON DELETE CASCADE
+);
+CREATE INDEX records_player_idx ON Records (player_id);
+
+-- Create table Ratings keeping each player's Elo rating across every
+-- tournament, updated by tournament.py whenever a match is reported.
+-- Players are added on their first rated match
+CREATE TABLE Ratings (
+    player_id integer PRIMARY KEY REFERENCES Players (id) ON DELETE CASCADE,
+    rating double precision NOT NULL,
+    matches integer NOT NULL DEFAULT 0
+);
+CREATE INDEX ratings_leaderboard_idx ON Ratings (rating DESC, player_id);
+
+-- Create tables keeping the final standings and every match outcome of
+-- tournaments moved out by purgeTournaments. Names are copied in and there
+-- are no foreign keys, so archived rows outlive the players and tournaments
+-- they describe
+CREATE TABLE Archived_Standings (
+    tourney_id integer,
+    tourney_name text,
+    player_id integer,
+    name text,
+    matches integer NOT NULL,
+    wins integer NOT NULL,
+    loses integer NOT NULL,
+    ties integer NOT NULL,
+    archived timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (tourney_id, player_id)
+);
+CREATE TABLE Archived_Matches (
+    match_id integer,
+    tourney_id integer,
+    player_id integer,
+    outcome text NOT NULL,
+    PRIMARY KEY (match_id, player_id)
+);
+CREATE INDEX archived_matches_tourney_idx ON Archived_Matches (tourney_id);
+
+-- Create view Computed_Standings to calculate player statistics from
+-- matchups. Used to check and rebuild Records (see rebuildStandings)
+CREATE VIEW Computed_Standings AS
     SELECT Contestants.tourney_id, Tourneys.name as tourney_name,
-           Contestants.player_id, Players.name, matched.matches,
-           win.wins, lose.loses, tie.ties
+           Contestants.player_id, Players.name,
+           COUNT(Match_Players.match_id) as matches,
+           COUNT(*) FILTER (WHERE outcome IN ('win', 'bye')) as wins,
+           COUNT(*) FILTER (WHERE outcome = 'loss') as loses,
+           COUNT(*) FILTER (WHERE outcome = 'tie') as ties
     FROM Contestants
-    LEFT JOIN (SELECT Contestants.tourney_id, Contestants.player_id,
-               COUNT(Matches.*) as matches
-               FROM Contestants
-               LEFT JOIN Matches 
-               ON Contestants.tourney_id = Matches.tourney_id
-               AND Contestants.player_id
-               IN (Matches.id_winner, Matches.id_loser, Matches.id_tie_a,
-                   Matches.id_tie_b)
-               GROUP BY Contestants.player_id, Contestants.tourney_id)
-    as matched ON Contestants.tourney_id = matched.tourney_id
-               AND Contestants.player_id = matched.player_id
-    LEFT JOIN (SELECT Contestants.tourney_id, Contestants.player_id,
-               COUNT(Matches.id_winner) as wins
-               FROM Contestants
-               LEFT JOIN Matches
-               ON Contestants.tourney_id = Matches.tourney_id
-               AND Contestants.player_id = Matches.id_winner
-               GROUP BY Contestants.tourney_id, Contestants.player_id)
-    as win ON Contestants.tourney_id = win.tourney_id
-           AND Contestants.player_id = win.player_id
-    LEFT JOIN (SELECT Contestants.tourney_id, Contestants.player_id,
-               COUNT(Matches.id_loser) as loses
-               FROM Contestants
-               LEFT JOIN Matches
-               ON Contestants.tourney_id = Matches.tourney_id
-               AND Contestants.player_id = Matches.id_loser
-               GROUP BY Contestants.tourney_id, Contestants.player_id)
-    as lose ON Contestants.tourney_id = lose.tourney_id
-            AND Contestants.player_id = lose.player_id
-    LEFT JOIN (SELECT Contestants.tourney_id, Contestants.player_id,
-               COUNT(ma.id_tie_a) + COUNT(mb.id_tie_b) as ties
-               FROM Contestants
-               LEFT JOIN Matches as ma
-               ON Contestants.tourney_id = ma.tourney_id
-               AND Contestants.player_id = ma.id_tie_a
-               LEFT JOIN Matches as mb
-               ON Contestants.tourney_id = mb.tourney_id
-               AND Contestants.player_id = mb.id_tie_b
-               GROUP BY Contestants.tourney_id, Contestants.player_id)
-    as tie ON Contestants.tourney_id = tie.tourney_id
-           AND Contestants.player_id = tie.player_id
     JOIN Tourneys ON Contestants.tourney_id = Tourneys.id
     JOIN Players ON Contestants.player_id = Players.id
+    LEFT JOIN Match_Players
+    ON Contestants.tourney_id = Match_Players.tourney_id
+    AND Contestants.player_id = Match_Players.player_id
+    GROUP BY Contestants.tourney_id, Tourneys.name, Contestants.player_id,
+             Players.name
     ORDER BY Contestants.tourney_id, Contestants.player_id;
+
+-- Create view Standings to view player statistics from Records
+CREATE VIEW Standings AS
+    SELECT Records.tourney_id, Tourneys.name as tourney_name,
+           Records.player_id, Players.name, Records.matches,
+           Records.wins, Records.loses, Records.ties
+    FROM Records
+    JOIN Tourneys ON Records.tourney_id = Tourneys.id
+    JOIN Players ON Records.player_id = Players.id
+    ORDER BY Records.tourney_id, Records.player_id;
@@ -0,0 +1,392 @@
+# ------------------------------------------------------------------------------
+# Name:         tournament_async
+# Purpose:      asyncio version of the tournament.py API for serving many
+#               clients from one event loop
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import asyncio
+import asyncpg
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import partial
+from tournament import PairingField
+from tournament import PAIRING_STRATEGIES
+from tournament import SNAPSHOT_QUERY
+from tournament import _nextRound
+from ratings import DEFAULT_RATING
+from ratings import updateRatings
+
+# Connection pool settings, change with configurePool. asyncpg only takes
+# URI style connection strings so this has its own environment variable,
+# TOURNAMENT_ASYNC_DSN
+DSN = os.environ.get("TOURNAMENT_ASYNC_DSN", "postgresql:///tournament")
+POOL_MIN = 1
+POOL_MAX = 10
+
+_pool = None
+_pool_lock = None
+_connection = ContextVar("connection", default=None)
+
+
+async def configurePool(dsn=None, min_size=None, max_size=None, **kwargs):
+    """Creates the connection pool used by connect(). Closes any existing
+       pool first so it can be called again to change settings. Only needs
+       to be called when the defaults are not suitable, connect() will
+       create a default pool on first use.
+
+       Args:
+            dsn: connection URI passed to asyncpg. Default DSN
+            min_size: number of connections kept open. Default POOL_MIN
+            max_size: maximum number of connections open at once, tasks
+                      wait for a free connection once reached.
+                      Default POOL_MAX
+            kwargs: any extra arguments for asyncpg.create_pool
+    """
+    if dsn is None:
+        dsn = DSN
+    if min_size is None:
+        min_size = POOL_MIN
+    if max_size is None:
+        max_size = POOL_MAX
+    async with _getLock():
+        await _openPool(dsn, min_size, max_size, kwargs)
+
+
+async def closePool():
+    """Closes every pooled connection. connect() will create a new pool
+    the next time it is used."""
+    global _pool
+    async with _getLock():
+        if _pool is not None:
+            await _pool.close()
+        _pool = None
+
+
+def _getLock():
+    """Returns the lock guarding the pool, created on first use so it
+    belongs to the running event loop"""
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    return _pool_lock
+
+
+async def _openPool(dsn, min_size, max_size, kwargs):
+    """Replaces the module pool. Caller must hold the pool lock"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+    _pool = await asyncpg.create_pool(dsn, min_size=min_size,
+                                      max_size=max_size, **kwargs)
+
+
+async def _getPool():
+    """Returns the connection pool, creating it with default settings if
+    configurePool has not been called"""
+    async with _getLock():
+        if _pool is None:
+            await _openPool(DSN, POOL_MIN, POOL_MAX, {})
+        return _pool
+
+
+@asynccontextmanager
+async def connect(isolation=None):
+    """Borrow a connection to the PostgreSQL database from the pool.
+    Use as an async context manager; the transaction is committed when the
+    block ends (rolled back if an error is raised) and the connection is
+    returned to the pool.
+
+    Calls nested inside an open block in the same task share its
+    connection and transaction, as with tournament.connect. Tasks started
+    inside a block would share it too, so gather calls outside of one.
+
+    Args:
+      isolation: isolation level of the transaction as named by asyncpg,
+                 such as "repeatable_read". Default None uses the server
+                 default. Ignored by nested blocks
+
+    Example:
+        async with connect() as tourney_db:
+            rows = await tourney_db.fetch(query)
+    """
+    tourney_db = _connection.get()
+    if tourney_db is not None:
+        yield tourney_db
+        return
+
+    pool = await _getPool()
+    async with pool.acquire() as tourney_db:
+        async with tourney_db.transaction(isolation=isolation):
+            token = _connection.set(tourney_db)
+            try:
+                yield tourney_db
+            finally:
+                _connection.reset(token)
+
+
+async def countPlayers(tourney=None):
+    """Returns the number of players, see tournament.countPlayers"""
+    async with connect() as tourney_db:
+        if tourney is not None:
+            query = "SELECT COUNT(*) FROM Contestants WHERE tourney_id = $1;"
+            return await tourney_db.fetchval(query, tourney)
+        return await tourney_db.fetchval("SELECT COUNT(*) FROM Players;")
+
+
+async def registerPlayer(player, tourney="free agent"):
+    """Adds a player to a tournament, see tournament.registerPlayer
+
+    Returns:
+      The id of the player
+    """
+    async with connect() as tourney_db:
+
+        # If a name is provided instead of an id; add a new player
+        if isinstance(player, int):
+            player_id = player
+        else:
+            query = "INSERT INTO Players (name) VALUES ($1) RETURNING id;"
+            player_id = await tourney_db.fetchval(query, str(player))
+
+        if isinstance(tourney, int):
+            tourney_id = tourney
+        elif tourney.lower() == "free agent":
+            tourney_id = await getLatestTournament()
+        else:
+            tourney_id = await createTournament(tourney)
+
+        query = ("WITH entrant AS (INSERT INTO Contestants (tourney_id, "
+                 "player_id) VALUES ($1, $2) RETURNING tourney_id, "
+                 "player_id) INSERT INTO Records (tourney_id, player_id) "
+                 "SELECT tourney_id, player_id FROM entrant;")
+        await tourney_db.execute(query, tourney_id, player_id)
+    return player_id
+
+
+async def createTournament(name):
+    """Adds a new tournament and returns its id, see
+    tournament.createTournament"""
+    async with connect() as tourney_db:
+        query = "INSERT INTO Tourneys (name) VALUES ($1) RETURNING id;"
+        return await tourney_db.fetchval(query, str(name))
+
+
+async def getLatestTournament():
+    """Returns the most recently created tournament, creating one called
+    'Open Tournament' if there are none, see tournament.getLatestTournament
+    """
+    async with connect() as tourney_db:
+        tourney_id = await tourney_db.fetchval("SELECT MAX(id) FROM Tourneys;")
+        if tourney_id is None:
+            tourney_id = await createTournament("Open Tournament")
+    return tourney_id
+
+
+async def playerStandings(player=None, detail=False):
+    """Returns the total records of players from all tournaments in the
+    same format as tournament.playerStandings"""
+    columns = ("player_id, name, SUM(matches), SUM(wins) as wins" +
+               (", SUM(loses), SUM(ties) as ties" if detail else ""))
+    order = "wins DESC, ties DESC" if detail else "wins DESC"
+    where = "WHERE player_id = $1 " if player is not None else ""
+    query = ("SELECT " + columns + " FROM Standings " + where +
+             "GROUP BY player_id, name ORDER BY " + order + ";")
+    query_add = [player] if player is not None else []
+    async with connect() as tourney_db:
+        rows = await tourney_db.fetch(query, *query_add)
+    return [tuple(row) for row in rows]
+
+
+async def tournamentStandings(tourney=None, detail=False):
+    """Returns the records of players in each tournament in the same format
+    as tournament.tournamentStandings"""
+    if tourney is not None:
+        if detail:
+            query = ("SELECT * FROM Standings WHERE "
+                     "tourney_id = $1 ORDER BY wins DESC, ties DESC;")
+        else:
+            query = ("SELECT player_id, name, matches, wins, ties "
+                     "FROM Standings WHERE tourney_id = $1 "
+                     "ORDER BY wins DESC, ties DESC;")
+        query_add = [tourney]
+    else:
+        if detail:
+            query = ("SELECT * FROM Standings "
+                     "ORDER BY tourney_id, wins DESC, ties DESC;")
+        else:
+            query = ("SELECT tourney_id, tourney_name, player_id, name, "
+                     "matches, wins, ties FROM Standings "
+                     "ORDER BY tourney_id, wins DESC, ties DESC;")
+        query_add = []
+    async with connect() as tourney_db:
+        rows = await tourney_db.fetch(query, *query_add)
+    return [tuple(row) for row in rows]
+
+
+async def leaderboard(top=10):
+    """Returns the highest rated players in the same format as
+    tournament.leaderboard"""
+    query = ("SELECT Ratings.player_id, Players.name, Ratings.rating, "
+             "Ratings.matches FROM Ratings "
+             "JOIN Players ON Ratings.player_id = Players.id "
+             "ORDER BY Ratings.rating DESC, Ratings.player_id LIMIT $1;")
+    async with connect() as tourney_db:
+        rows = await tourney_db.fetch(query, top)
+    return [tuple(row) for row in rows]
+
+
+async def reportMatch(winner, loser, tourney=None, tied=False):
+    """Records the outcome of a single match, see tournament.reportMatch"""
+    async with connect() as tourney_db:
+        if tourney is None:
+            tourney = await getLatestTournament()
+        await _recordResults(tourney_db, tourney, [(winner, loser, tied)])
+
+
+async def reportRound(tourney, results):
+    """Records every match of a round in one transaction, see
+    tournament.reportRound
+
+    Raises:
+      ValueError: if any player is not registered to the tournament
+    """
+    players = set()
+    for (winner, loser, tied) in results:
+        players.add(winner)
+        if loser is not None:
+            players.add(loser)
+
+    async with connect() as tourney_db:
+        query = ("SELECT player_id FROM Contestants "
+                 "WHERE tourney_id = $1 AND player_id = ANY($2::int[]);")
+        rows = await tourney_db.fetch(query, tourney, list(players))
+        missing = players - set(row[0] for row in rows)
+        if missing:
+            raise ValueError("Players {0} are not registered to tournament "
+                             "{1}".format(sorted(missing), tourney))
+        await _recordResults(tourney_db, tourney, results)
+
+
+async def _recordResults(tourney_db, tourney_id, results):
+    """Inserts results into Matches, Match_Players, Pairings, Records and
+    Ratings the same way as tournament._recordResults. asyncpg has no
+    execute_values so each statement takes its rows as arrays and unnests
+    them"""
+    if not results:
+        return
+    matches = ([], [], [])
+    totals = {}
+    pairs = set()
+    for (winner, loser, tied) in results:
+        for (column, value) in zip(matches, (winner, loser, bool(tied))):
+            column.append(value)
+        if loser is not None:
+            pairs.add((min(winner, loser), max(winner, loser)))
+
+        # Totals for each player are [matches, wins, loses, ties]
+        outcomes = ((winner, 3 if tied else 1), (loser, 3 if tied else 2))
+        for (player, column) in outcomes:
+            if player is not None:
+                total = totals.setdefault(player, [0, 0, 0, 0])
+                total[0] += 1
+                total[column] += 1
+
+    query = ("WITH results AS (SELECT nextval('matches_id_seq') AS id, "
+             "r.* FROM unnest($2::int[], $3::int[], $4::bool[]) "
+             "AS r (winner, loser, tied)), "
+             "new_matches AS (INSERT INTO Matches (id, tourney_id) "
+             "SELECT id, $1 FROM results) "
+             "INSERT INTO Match_Players (match_id, tourney_id, player_id, "
+             "outcome) SELECT id, $1, winner, CASE WHEN tied "
+             "THEN 'tie' WHEN loser IS NULL THEN 'bye' ELSE 'win' END "
+             "FROM results UNION ALL SELECT id, $1, loser, CASE "
+             "WHEN tied THEN 'tie' ELSE 'loss' END FROM results "
+             "WHERE loser IS NOT NULL;")
+    await tourney_db.execute(query, tourney_id, *matches)
+
+    # Index each matchup by the lower id first (byes have no opponent)
+    if pairs:
+        query = ("INSERT INTO Pairings (tourney_id, id_low, id_high) "
+                 "SELECT $1, * FROM unnest($2::int[], $3::int[]) "
+                 "ON CONFLICT DO NOTHING;")
+        (id_low, id_high) = zip(*pairs)
+        await tourney_db.execute(query, tourney_id, list(id_low),
+                                 list(id_high))
+    query = ("UPDATE Records SET matches = Records.matches + t.matches, "
+             "wins = Records.wins + t.wins, "
+             "loses = Records.loses + t.loses, "
+             "ties = Records.ties + t.ties "
+             "FROM unnest($2::int[], $3::int[], $4::int[], $5::int[], "
+             "$6::int[]) AS t (player_id, matches, wins, loses, ties) "
+             "WHERE Records.tourney_id = $1 "
+             "AND Records.player_id = t.player_id;")
+    columns = [list(column) for column in
+               zip(*[(player,) + tuple(total)
+                     for (player, total) in totals.items()])]
+    await tourney_db.execute(query, tourney_id, *columns)
+
+    # Ratings are locked in id order, as in tournament._rateResults
+    players = sorted(set(player for pair in pairs for player in pair))
+    if not players:
+        return
+    query = ("INSERT INTO Ratings (player_id, rating) "
+             "SELECT player_id, $2 FROM unnest($1::int[]) AS player_id "
+             "ORDER BY player_id ON CONFLICT DO NOTHING;")
+    await tourney_db.execute(query, players, DEFAULT_RATING)
+    query = ("SELECT player_id, rating, matches FROM Ratings "
+             "WHERE player_id = ANY($1::int[]) ORDER BY player_id "
+             "FOR UPDATE;")
+    ratings = dict((row[0], (row[1], row[2])) for row in
+                   await tourney_db.fetch(query, players))
+    changed = sorted(updateRatings(ratings, results))
+    query = ("INSERT INTO Ratings (player_id, rating, matches) "
+             "SELECT * FROM unnest($1::int[], $2::float8[], $3::int[]) "
+             "ON CONFLICT (player_id) DO UPDATE SET "
+             "rating = EXCLUDED.rating, matches = EXCLUDED.matches;")
+    await tourney_db.execute(query, changed,
+                             [ratings[player][0] for player in changed],
+                             [ratings[player][1] for player in changed])
+
+
+async def pairingSnapshot(tourney=None):
+    """Reads everything needed to pair a tournament's next round in one
+    round trip and one REPEATABLE READ transaction, see
+    tournament.pairingSnapshot"""
+    # asyncpg numbers its parameters and returns json as text
+    query = SNAPSHOT_QUERY.replace("%s", "$1")
+    async with connect("repeatable_read") as tourney_db:
+        (tourney_id, standings, past_pairings, byes) = \
+            await tourney_db.fetchrow(query, tourney)
+    if tourney_id is None:
+        return await getLatestTournament(), PairingField([]), set(), set()
+    return (tourney_id, PairingField(json.loads(standings or "[]")),
+            set(tuple(pair) for pair in past_pairings), set(byes))
+
+
+async def swissPairings(tourney=None, strategy="random", **options):
+    """Returns pairings for the next round of a tournament in the same
+    format as tournament.swissPairings, recording a bye if one is given.
+
+    The pairing itself runs in the event loop's default executor so a
+    slow strategy (such as "matching" on a large field) does not hold up
+    other tasks.
+    """
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError("Unknown pairing strategy {0!r}".format(strategy))
+
+    tourney, field, past_pairings, byes = await pairingSnapshot(tourney)
+    loop = asyncio.get_running_loop()
+    pairings, bye = await loop.run_in_executor(
+        None, partial(_nextRound, field, past_pairings, byes, strategy,
+                      **options))
+
+    # A bye counts as a win against no one, as in tournament.swissPairings
+    if bye:
+        await reportMatch(bye, None, tourney, False)
+    return pairings
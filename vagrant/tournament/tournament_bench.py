@@ -0,0 +1,332 @@
+# ------------------------------------------------------------------------------
+# Name:         tournament_bench
+# Purpose:      Benchmarks for timing the pairing code in tournament.py, the
+#               standings queries of tournament.py and tournament_async.py
+#               and whole simulated tournaments against the database
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import argparse
+import json
+import threading
+from tournament import POOL_MAX
+from tournament import PAIRING_STRATEGIES
+from tournament import PairingField
+from tournament import TimedCursor
+from tournament import closePool
+from tournament import configurePool
+from tournament import createTournament
+from tournament import deleteTournaments
+from tournament import registerPlayers
+from tournament import reportRound
+from tournament import swissPairings
+from tournament import tournamentStandings
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from math import log
+from random import random
+from random import seed
+from time import perf_counter
+
+# Benchmarks below run the pairing strategies on simulated standings held in
+# memory, so no database is needed and only the pairing itself is timed
+
+
+def simulatePairings(num_players, strategy="random"):
+    """Plays a whole simulated tournament, pairing each round with the given
+       strategy and picking winners at random
+
+       Args:
+            num_players: number of entrants in the simulated tournament
+            strategy: swissPairings strategy to time. Default "random"
+
+       Returns:
+            A list with the seconds taken to pair each round
+    """
+    pairing = PAIRING_STRATEGIES[strategy]
+
+    # Records are [matches, wins, ties] for each player id
+    records = dict((i, [0, 0, 0]) for i in range(1, num_players + 1))
+    past_pairings = set()
+    byes = set()
+    timings = []
+    for round_no in range(int(ceil(log(num_players, 2)))):
+        standings = sorted(((i, "Player {0}".format(i), m, w, t)
+                            for (i, (m, w, t)) in records.items()),
+                           key=lambda row: (-row[3], -row[4]))
+        start = perf_counter()
+        pairings, bye = pairing(PairingField(standings), past_pairings, byes)
+        timings.append(perf_counter() - start)
+        if not pairings:
+            break
+
+        # Record random results the same way reportMatch would
+        for (id1, name1, id2, name2) in pairings:
+            past_pairings.add((min(id1, id2), max(id1, id2)))
+            winner = id1 if random() < 0.5 else id2
+            records[winner][1] += 1
+            records[id1][0] += 1
+            records[id2][0] += 1
+        if bye is not None:
+            byes.add(bye)
+            records[bye][0] += 1
+            records[bye][1] += 1
+    return timings
+
+
+def benchPairings(sizes=(16, 256, 1000, 10000), strategy="random"):
+    """Prints the time taken to pair the first round and the slowest round
+       of simulated tournaments of each size
+
+       Args:
+            sizes: numbers of entrants to simulate
+            strategy: swissPairings strategy to time. Default "random"
+    """
+    print ("\n~~ PAIRING: {0} ~~".format(strategy))
+    for num_players in sizes:
+        timings = simulatePairings(num_players, strategy)
+        output = ("PLAYERS: {0:>6}   ROUNDS: {1:>2}   FIRST: {2:8.2f} ms   "
+                  "SLOWEST: {3:8.2f} ms").format(num_players, len(timings),
+                                                 timings[0] * 1000,
+                                                 max(timings) * 1000)
+        print (output)
+
+
+# Benchmarks below need the tournament database. They create their own
+# tournament and delete it when done
+
+
+def benchStandings(clients=(1, 10, 50), calls=1000, num_players=256):
+    """Prints how many tournamentStandings calls per second can be served
+       to many clients at once by tournament.py (one thread per client) and
+       by tournament_async.py (one task per client on one event loop).
+       Both use a pool with one connection per client.
+
+       Args:
+            clients: numbers of concurrent clients to try
+            calls: total calls made, shared evenly between the clients
+            num_players: number of entrants in the benchmark tournament
+    """
+    import asyncio
+
+    names = ["Bench Player {0}".format(n) for n in range(num_players)]
+    tourney_id = createTournament("Bench Tournament")
+    players = registerPlayers(names, tourney_id)
+    reportRound(tourney_id, [(players[i][0], players[i + 1][0], False)
+                             for i in range(0, num_players - 1, 2)])
+    print ("\n~~ STANDINGS: {0} players, {1} calls ~~".format(num_players,
+                                                              calls))
+    try:
+        sync_rates = []
+        for num_clients in clients:
+            per_client = calls // num_clients
+            configurePool(None, 1, num_clients)
+
+            def client(_):
+                for _ in range(per_client):
+                    tournamentStandings(tourney_id)
+
+            start = perf_counter()
+            with ThreadPoolExecutor(num_clients) as executor:
+                list(executor.map(client, range(num_clients)))
+            sync_rates.append(per_client * num_clients /
+                              (perf_counter() - start))
+        async_rates = asyncio.run(_asyncStandings(tourney_id, clients, calls))
+    finally:
+        closePool()
+        deleteTournaments(tourney_id)
+    for (num_clients, sync_rate, async_rate) in zip(clients, sync_rates,
+                                                    async_rates):
+        output = ("CLIENTS: {0:>4}   SYNC: {1:8.0f} /s   ASYNC: {2:8.0f} /s"
+                  ).format(num_clients, sync_rate, async_rate)
+        print (output)
+
+
+async def _asyncStandings(tourney_id, clients, calls):
+    """Async half of benchStandings, returns the calls per second served
+    for each number of clients"""
+    import asyncio
+    import tournament_async
+
+    async def client(per_client):
+        for _ in range(per_client):
+            await tournament_async.tournamentStandings(tourney_id)
+
+    rates = []
+    for num_clients in clients:
+        per_client = calls // num_clients
+        await tournament_async.configurePool(None, num_clients, num_clients)
+        start = perf_counter()
+        await asyncio.gather(*[client(per_client)
+                               for _ in range(num_clients)])
+        rates.append(per_client * num_clients / (perf_counter() - start))
+    await tournament_async.closePool()
+    return rates
+
+
+PHASES = ("registration", "pairing", "reporting", "standings")
+
+# Statements sent to the database by each thread, counted by CountingCursor
+_round_trips = threading.local()
+
+
+class CountingCursor(TimedCursor):
+    """Cursor counting every statement it sends to the database. Passed to
+    configurePool as the cursor_factory of every pooled connection"""
+
+    def execute(self, query, vars=None):
+        _round_trips.count = getattr(_round_trips, "count", 0) + 1
+        return super(CountingCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _round_trips.count = (getattr(_round_trips, "count", 0) +
+                              len(vars_list))
+        return super(CountingCursor, self).executemany(query, vars_list)
+
+
+def simulateTournament(num_players, strategy="random", ties=False):
+    """Plays a whole simulated tournament against the database, timing each
+       call made to tournament.py and counting its round trips. The
+       tournament is deleted afterwards.
+
+       Args:
+            num_players: number of entrants in the simulated tournament
+            strategy: swissPairings strategy to use. Default "random"
+            ties: True allows random ties. Default False
+
+       Returns:
+            A dict of phase name (see PHASES) to a list of
+            (seconds, round trips) for each call in that phase
+    """
+    timings = dict((phase, []) for phase in PHASES)
+
+    def timed(phase, function, *args):
+        count = getattr(_round_trips, "count", 0)
+        start = perf_counter()
+        output = function(*args)
+        timings[phase].append((perf_counter() - start,
+                               getattr(_round_trips, "count", 0) - count))
+        return output
+
+    names = ["Bench Player {0}".format(n) for n in range(num_players)]
+    tourney_id = createTournament("Bench Tournament {0}".format(num_players))
+    try:
+        timed("registration", registerPlayers, names, tourney_id)
+        while True:
+            pairings = timed("pairing", swissPairings, tourney_id, strategy)
+            if not pairings or pairings == [None]:
+                break
+            results = []
+            for (id1, name1, id2, name2) in pairings:
+                outcome = random()
+                results.append((id1, id2, False) if outcome < 0.45 else
+                               (id2, id1, ties and outcome > 0.9))
+            timed("reporting", reportRound, tourney_id, results)
+            timed("standings", tournamentStandings, tourney_id)
+    finally:
+        deleteTournaments(tourney_id)
+    return timings
+
+
+def benchTournaments(sizes=(16, 1000, 10000, 100000), concurrent=1,
+                     strategy="random", output=None):
+    """Prints the latency of each phase of simulated tournaments, and the
+       database round trips made, for each size of tournament. Runs
+       concurrent tournaments of each size at once, one thread each.
+
+       Args:
+            sizes: numbers of entrants to simulate
+            concurrent: number of tournaments run at the same time
+            strategy: swissPairings strategy to use. Default "random"
+            output: file to append the results to as JSON lines, one for
+                    each size and phase. Default None only prints them
+
+       Returns:
+            A list of the result dicts
+    """
+    configurePool(None, 1, max(concurrent, POOL_MAX),
+                  cursor_factory=CountingCursor)
+    print ("\n~~ TOURNAMENTS: {0}, {1} at once ~~".format(strategy,
+                                                          concurrent))
+    records = []
+    try:
+        for num_players in sizes:
+            with ThreadPoolExecutor(concurrent) as executor:
+                runs = list(executor.map(
+                    lambda _: simulateTournament(num_players, strategy),
+                    range(concurrent)))
+            for phase in PHASES:
+                calls = [call for timings in runs for call in timings[phase]]
+                record = _summarise(calls)
+                record.update(players=num_players, tourneys=concurrent,
+                              strategy=strategy, phase=phase)
+                records.append(record)
+                output_line = ("PLAYERS: {players:>6}   {phase:<12}  "
+                               "CALLS: {calls:>3}   MEAN: {mean_ms:9.2f} ms"
+                               "   P95: {p95_ms:9.2f} ms   ROUND TRIPS: "
+                               "{round_trips:>5}").format(**record)
+                print (output_line)
+    finally:
+        closePool()
+    if output is not None:
+        with open(output, "a") as results_file:
+            for record in records:
+                results_file.write(json.dumps(record, sort_keys=True) + "\n")
+    return records
+
+
+def _summarise(calls):
+    """Returns a dict of latency statistics for a list of (seconds, round
+    trips) calls"""
+    seconds = sorted(call[0] for call in calls) or [0.0]
+
+    def percentile(fraction):
+        return seconds[int(round(fraction * (len(seconds) - 1)))] * 1000
+
+    return {"calls": len(calls),
+            "total_s": sum(seconds),
+            "mean_ms": sum(seconds) * 1000 / len(seconds),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": seconds[-1] * 1000,
+            "round_trips": sum(call[1] for call in calls)}
+
+
+if __name__ == '__main__':
+
+    # Run "python tournament_bench.py standings" or
+    # "python tournament_bench.py simulate [sizes...] [--concurrent N]
+    # [--strategy NAME] [--json FILE]" for the database benchmarks
+    parser = argparse.ArgumentParser(
+        description="Times the pairing strategies, or with a command the "
+                    "database benchmarks")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("standings",
+                        help="standings calls per second served at once")
+    simulate = commands.add_parser("simulate",
+                                   help="play whole tournaments against the "
+                                        "database")
+    simulate.add_argument("sizes", nargs="*", type=int,
+                          default=[16, 1000, 10000, 100000])
+    simulate.add_argument("--concurrent", type=int, default=1, metavar="N")
+    simulate.add_argument("--strategy", default="random",
+                          choices=sorted(PAIRING_STRATEGIES))
+    simulate.add_argument("--json", metavar="FILE",
+                          help="append the results as JSON lines")
+    args = parser.parse_args()
+    if args.command == "standings":
+        benchStandings()
+    elif args.command == "simulate":
+        seed(2015)
+        benchTournaments(tuple(args.sizes), args.concurrent, args.strategy,
+                         args.json)
+    else:
+
+        # Same seed every run so results can be compared between changes
+        seed(2015)
+        benchPairings()
+        benchPairings((16, 128, 256, 512), "matching")
@@ -0,0 +1,344 @@
+# ------------------------------------------------------------------------------
+# Name:         tournament_engine
+# Purpose:      Run many tournaments from memory, writing results back to the
+#               database in batches
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import threading
+from tournament import connect
+from tournament import PairingField
+from tournament import PAIRING_STRATEGIES
+from tournament import _nextRound
+from tournament import _recordResults
+
+
+class TournamentEngine(object):
+    """Keeps the standings and pairing history of tournaments in memory.
+
+    Tournaments are loaded from the database once, after which standings
+    and pairings are served without touching the database. Reported
+    results update memory straight away and are written to the database
+    later (write-behind) in batches, one transaction per flush.
+
+    Results not yet flushed are lost if the process stops without calling
+    flush or close. Players registered after a tournament is loaded are not
+    seen until the tournament is loaded again.
+
+    Example:
+        with TournamentEngine() as engine:
+            pairings = engine.swissPairings(tourney_id)
+            engine.reportRound(tourney_id, results)
+
+    Args:
+        tourneys: list of tournament ids to load. Default None loads all
+        batch_size: number of unsaved results that triggers a flush.
+                    Default 256
+        flush_interval: seconds between flushes from a background thread.
+                        Default None only flushes by batch_size or when
+                        flush is called
+    """
+
+    def __init__(self, tourneys=None, batch_size=256, flush_interval=None):
+        self.batch_size = batch_size
+        self._tourneys = {}
+        self._pending = []
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self.load(tourneys)
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flushEvery,
+                                             args=(flush_interval,))
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self, tourneys=None):
+        """(Re)loads tournaments from the database, replacing anything held
+        in memory for them. Unsaved results are flushed first.
+
+        Args:
+            tourneys: list of tournament ids to load. Default None loads all
+        """
+        self.flush()
+        loaded = self._fetch(tourneys)
+        with self._lock:
+            if tourneys is not None:
+                for tourney_id in tourneys:
+                    self._tourneys.pop(tourney_id, None)
+            else:
+                self._tourneys.clear()
+            self._tourneys.update(loaded)
+
+    def _fetch(self, tourneys=None):
+        """Returns a dict of tourney id to _TourneyState read from the
+        database in one REPEATABLE READ transaction, so every query sees
+        the same tournaments and players"""
+        where = "" if tourneys is None else " WHERE tourney_id = ANY(%s)"
+        query_add = [] if tourneys is None else [list(tourneys)]
+        loaded = {}
+        with connect("REPEATABLE READ") as tourney_db:
+            cursor = tourney_db.cursor()
+            query = "SELECT id, name FROM Tourneys"
+            if tourneys is not None:
+                query += " WHERE id = ANY(%s)"
+            cursor.execute(query + ";", query_add)
+            for (tourney_id, name) in cursor.fetchall():
+                loaded[tourney_id] = _TourneyState(name)
+
+            query = ("SELECT tourney_id, player_id, name, matches, wins, "
+                     "loses, ties FROM Standings" + where + ";")
+            cursor.execute(query, query_add)
+            for row in cursor.fetchall():
+                loaded[row[0]].players[row[1]] = list(row[2:])
+
+            query = ("SELECT tourney_id, id_low, id_high FROM Pairings" +
+                     where + ";")
+            cursor.execute(query, query_add)
+            for (tourney_id, id_low, id_high) in cursor.fetchall():
+                loaded[tourney_id].pairings.add((id_low, id_high))
+
+            query = ("SELECT tourney_id, player_id FROM Match_Players "
+                     "WHERE outcome = 'bye'" +
+                     where.replace(" WHERE", " AND") + ";")
+            cursor.execute(query, query_add)
+            for (tourney_id, player_id) in cursor.fetchall():
+                loaded[tourney_id].byes.add(player_id)
+        return loaded
+
+    def tournaments(self):
+        """Returns a list of (tourney_id, tourney_name) held in memory"""
+        with self._lock:
+            return sorted((tourney_id, state.name) for (tourney_id, state)
+                          in self._tourneys.items())
+
+    def reportMatch(self, winner, loser, tourney, tied=False):
+        """Records the outcome of a single match, see reportRound"""
+        self.reportRound(tourney, [(winner, loser, tied)])
+
+    def reportRound(self, tourney, results):
+        """Records the outcome of matches in memory and queues them to be
+        saved to the database.
+
+        Args:
+          tourney: the id number of the tournament for these matches
+          results: a list of tuples, each of which contains
+                   (winner, loser, tied) as for tournament.reportRound
+
+        Raises:
+          ValueError: if any player is not registered to the tournament
+        """
+        results = [tuple(result) for result in results]
+        self._load(tourney)
+        with self._lock:
+            state = self._state(tourney)
+            for (winner, loser, tied) in results:
+                for player in (winner, loser):
+                    if player is not None and player not in state.players:
+                        raise ValueError("Player {0} is not registered to "
+                                         "tournament {1}".format(player,
+                                                                 tourney))
+            pending = self._queue(tourney, state, results)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def _queue(self, tourney, state, results):
+        """Applies results to memory and queues them for the next flush.
+        Caller must hold self._lock. Returns the number of queued results"""
+        for (winner, loser, tied) in results:
+            state.record(winner, loser, tied)
+            self._pending.append((tourney, winner, loser, tied))
+        return len(self._pending)
+
+    def flush(self):
+        """Saves every queued result to the database in one transaction.
+        Never called while holding self._lock, as flush takes its locks in
+        the order _flush_lock then _lock.
+
+        Returns:
+            The number of results saved
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = []
+            if not pending:
+                return 0
+            rounds = {}
+            for (tourney, winner, loser, tied) in pending:
+                rounds.setdefault(tourney, []).append((winner, loser, tied))
+            try:
+                with connect() as tourney_db:
+                    cursor = tourney_db.cursor()
+                    for tourney_id in sorted(rounds):
+                        _recordResults(cursor, tourney_id, rounds[tourney_id])
+            except Exception:
+
+                # Put the results back in front of anything newer so they
+                # are saved in order by the next flush
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+        return len(pending)
+
+    def close(self):
+        """Stops the background flush thread and saves queued results"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def playerStandings(self, player=None, detail=False):
+        """Returns the total records of players from every loaded tournament
+        in the same format as tournament.playerStandings"""
+        with self._lock:
+            return _playerStandings(self._tourneys.values(), player, detail)
+
+    def tournamentStandings(self, tourney=None, detail=False):
+        """Returns the records of players in the same format as
+        tournament.tournamentStandings"""
+        if tourney is not None:
+            self._load(tourney)
+        with self._lock:
+            if tourney is not None:
+                states = [(tourney, self._state(tourney))]
+            else:
+                states = sorted(self._tourneys.items())
+            return _tournamentStandings(states, tourney, detail)
+
+    def swissPairings(self, tourney, strategy="random", **options):
+        """Returns pairings for the next round of a tournament in the same
+        format as tournament.swissPairings, from memory. A bye is recorded
+        like any other result."""
+        if strategy not in PAIRING_STRATEGIES:
+            raise ValueError("Unknown pairing strategy {0!r}"
+                             .format(strategy))
+        self._load(tourney)
+        with self._lock:
+            state = self._state(tourney)
+            field = PairingField((player_id, name, matches, wins, ties)
+                                 for (player_id, name, matches, wins, loses,
+                                      ties) in state.standings())
+            pairings, bye = _nextRound(field, state.pairings, state.byes,
+                                       strategy, **options)
+            pending = self._queue(tourney, state, [(bye, None, False)]) \
+                if bye else 0
+        if pending >= self.batch_size:
+            self.flush()
+        return pairings
+
+    def _load(self, tourney):
+        """Loads a tournament into memory if it is not there already. Must
+        not be called while holding self._lock: the database is read
+        without it so other threads are not held up, then the state is
+        only added if another thread has not loaded it in the meantime.
+        Nothing is flushed, a tournament not yet in memory has no queued
+        results anyway"""
+        with self._lock:
+            if tourney in self._tourneys:
+                return
+        loaded = self._fetch([tourney])
+        with self._lock:
+            for (tourney_id, state) in loaded.items():
+                self._tourneys.setdefault(tourney_id, state)
+
+    def _state(self, tourney):
+        """Returns the in memory state of a tournament loaded by _load.
+        Caller must hold self._lock"""
+        if tourney not in self._tourneys:
+            raise ValueError("Unknown tournament {0}".format(tourney))
+        return self._tourneys[tourney]
+
+    def _flushEvery(self, interval):
+        """Background thread flushing queued results every interval"""
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                # Results stay queued, try again next interval
+                pass
+
+
+def _playerStandings(states, player=None, detail=False):
+    """Returns rows as tournament.playerStandings does, totalled from a list
+    of _TourneyState. Shared with tournament_memory.MemoryBackend"""
+    totals = {}
+    for state in states:
+        for (player_id, record) in state.players.items():
+            if player is not None and player_id != player:
+                continue
+            total = totals.setdefault(player_id, [record[0], 0, 0, 0, 0])
+            for column in range(1, 5):
+                total[column] += record[column]
+    rows = [(player_id,) + tuple(total) for (player_id, total)
+            in sorted(totals.items())]
+    if detail:
+        rows.sort(key=lambda row: (-row[3], -row[5]))
+        return rows
+    rows.sort(key=lambda row: -row[3])
+    return [row[:4] for row in rows]
+
+
+def _tournamentStandings(states, tourney=None, detail=False):
+    """Returns rows as tournament.tournamentStandings does, from a list of
+    (tourney_id, _TourneyState) in id order. Shared with
+    tournament_memory.MemoryBackend"""
+    standings = []
+    for (tourney_id, state) in states:
+        for (player_id, name, matches, wins, loses, ties) \
+                in state.standings():
+            if tourney is not None and not detail:
+                row = (player_id, name, matches, wins, ties)
+            elif detail:
+                row = (tourney_id, state.name, player_id, name, matches, wins,
+                       loses, ties)
+            else:
+                row = (tourney_id, state.name, player_id, name, matches, wins,
+                       ties)
+            standings.append(row)
+    return standings
+
+
+class _TourneyState(object):
+    """Standings and pairing history of one tournament held in memory"""
+    __slots__ = ('name', 'players', 'pairings', 'byes')
+
+    def __init__(self, name):
+        self.name = name
+
+        # players maps player id to [name, matches, wins, loses, ties]
+        self.players = {}
+        self.pairings = set()
+        self.byes = set()
+
+    def record(self, winner, loser, tied):
+        """Adds the outcome of a match the same way _recordResults does"""
+        outcomes = ((winner, 4 if tied else 2), (loser, 4 if tied else 3))
+        for (player, column) in outcomes:
+            if player is not None:
+                self.players[player][1] += 1
+                self.players[player][column] += 1
+        if loser is None:
+            if not tied:
+                self.byes.add(winner)
+        else:
+            self.pairings.add((min(winner, loser), max(winner, loser)))
+
+    def standings(self):
+        """Returns (id, name, matches, wins, loses, ties) of every player,
+        most wins then most ties first"""
+        rows = [(player_id,) + tuple(record) for (player_id, record)
+                in self.players.items()]
+        rows.sort(key=lambda row: (-row[3], -row[5], row[0]))
+        return rows
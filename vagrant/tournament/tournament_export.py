@@ -0,0 +1,135 @@
+# ------------------------------------------------------------------------------
+# Name:         tournament_export
+# Purpose:      Writes standings to CSV or JSON lines files a row at a time,
+#               for exporting every tournament in constant memory
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+import sys
+import argparse
+import csv
+import json
+from decimal import Decimal
+from tournament import iterPlayerStandings
+from tournament import iterTournamentStandings
+
+# Column names of each shape of row returned by tournamentStandings and
+# playerStandings, see standingsColumns
+TOURNEY_COLUMNS = ("tourney_id", "tourney_name")
+RECORD_COLUMNS = ("player_id", "name", "matches", "wins")
+
+
+def standingsColumns(tourney=None, detail=False, players=False):
+    """Returns the column names of the rows returned by
+    tournamentStandings(tourney, detail), or playerStandings(player,
+    detail) if players is True"""
+    if players:
+        return RECORD_COLUMNS + (("loses", "ties") if detail else ())
+    if detail:
+        return TOURNEY_COLUMNS + RECORD_COLUMNS + ("loses", "ties")
+    if tourney is not None:
+        return RECORD_COLUMNS + ("ties",)
+    return TOURNEY_COLUMNS + RECORD_COLUMNS + ("ties",)
+
+
+def writeCsv(output, rows, columns):
+    """Writes a header of columns then each row to a CSV file
+
+    Args:
+      output: a text file opened with newline=""
+      rows: an iterable of tuples in the order of columns
+      columns: the column names
+
+    Returns:
+      The number of rows written
+    """
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    written = 0
+    for row in rows:
+        writer.writerow(row)
+        written += 1
+    return written
+
+
+def writeJsonLines(output, rows, columns):
+    """Writes each row to a text file as a JSON object on its own line,
+    keyed by column name
+
+    Args:
+      output: a text file
+      rows: an iterable of tuples in the order of columns
+      columns: the column names
+
+    Returns:
+      The number of rows written
+    """
+    written = 0
+    for row in rows:
+        output.write(json.dumps(dict(zip(columns, row)), default=_jsonValue))
+        output.write("\n")
+        written += 1
+    return written
+
+
+def _jsonValue(value):
+    """Converts the totals PostgreSQL returns as Decimal (see
+    playerStandings) for json"""
+    if isinstance(value, Decimal):
+        return int(value) if value == int(value) else float(value)
+    raise TypeError("{0!r} can not be written as JSON".format(value))
+
+
+WRITERS = {"csv": writeCsv, "jsonl": writeJsonLines}
+
+
+def exportStandings(output, format="csv", tourney=None, detail=False,
+                    players=False, fetch_size=None):
+    """Streams standings from the database to a file without holding them
+    all in memory.
+
+    Args:
+      output: a text file to write to
+      format: "csv" or "jsonl" (one JSON object per line). Default "csv"
+      tourney: tournament id as for tournamentStandings, or player id as
+               for playerStandings if players is True. Default every row
+      detail: boolean, include the detailed columns. Default False
+      players: boolean, export each player's totals across tournaments
+               instead of tournament standings. Default False
+      fetch_size: rows fetched from the database at once, see
+                  tournament.STREAM_FETCH_SIZE
+
+    Returns:
+      The number of rows written
+    """
+    if format not in WRITERS:
+        raise ValueError("Unknown export format {0!r}".format(format))
+    if players:
+        rows = iterPlayerStandings(tourney, detail, fetch_size)
+    else:
+        rows = iterTournamentStandings(tourney, detail, fetch_size)
+    columns = standingsColumns(tourney, detail, players)
+    return WRITERS[format](output, rows, columns)
+
+
+if __name__ == '__main__':
+
+    # Command line use: python tournament_export.py csv|jsonl [--detail]
+    # [--players] [--fetch-size N] [id] > standings.csv
+    parser = argparse.ArgumentParser(
+        description="Writes standings to standard output")
+    parser.add_argument("format", choices=sorted(WRITERS))
+    parser.add_argument("id", nargs="?", type=int,
+                        help="tournament id, or player id with --players")
+    parser.add_argument("--detail", action="store_true",
+                        help="include the detailed columns")
+    parser.add_argument("--players", action="store_true",
+                        help="export each player's totals instead")
+    parser.add_argument("--fetch-size", type=int, metavar="N",
+                        help="rows fetched from the database at once")
+    args = parser.parse_args()
+    exportStandings(sys.stdout, args.format, args.id, args.detail,
+                    args.players, args.fetch_size)
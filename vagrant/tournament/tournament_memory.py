@@ -0,0 +1,324 @@
+# ------------------------------------------------------------------------------
+# Name:         tournament_memory
+# Purpose:      In memory storage backend for tournament.py, for running
+#               tests and simulations without PostgreSQL
+#
+# Author:       Jordan Alexander Watt
+#
+# Created:      18-10-2026
+# ------------------------------------------------------------------------------
+
+from heapq import merge
+from heapq import nlargest
+from itertools import count
+from tournament import PairingField
+from tournament import PAIRING_STRATEGIES
+from tournament import _addTiebreaks
+from tournament import _nextRound
+from tournament_engine import _TourneyState
+from tournament_engine import _playerStandings
+from tournament_engine import _tournamentStandings
+from ratings import updateRatings
+
+
+class MemoryBackend(object):
+    """Keeps players, tournaments and matches in memory, with the same
+    functions and results as tournament.py on PostgreSQL. Use it through
+    tournament.useBackend:
+
+    Example:
+        useBackend(MemoryBackend())
+        registerPlayers(names, "Simulated Tournament")
+        pairings = swissPairings()
+
+    Ids are assigned the way tournament.sql does (players from 1,
+    tournaments from 1001) but restart with every backend. Rows with equal
+    wins and ties are returned lowest id first, where PostgreSQL returns
+    them in no set order. A backend should only be used by one thread at
+    a time.
+    """
+
+    def __init__(self):
+        self.players = {}
+        self.tourneys = {}
+        self.ratings = {}
+        self.archived_standings = []
+        self.archived_matches = []
+        self._player_ids = count(1)
+        self._tourney_ids = count(1001)
+        self._match_ids = count(1)
+
+    def deleteMatches(self, tourney=None):
+        for state in self._select(tourney):
+            state.matches = []
+            state.pairings.clear()
+            state.byes.clear()
+            for record in state.players.values():
+                record[1:] = [0, 0, 0, 0]
+        if tourney is None:
+            self.ratings.clear()
+
+    def deletePlayers(self, player=None):
+        if player is None:
+            removed = set(self.players)
+        elif str(player).lower() == "clear":
+            entered = set()
+            for state in self.tourneys.values():
+                entered.update(state.players)
+            removed = set(self.players) - entered
+        else:
+            removed = set([player]) & set(self.players)
+
+        # Matches keep their players, as in Match_Players
+        for state in self.tourneys.values():
+            for (match_id, winner, loser, tied) in state.matches:
+                if winner in removed or loser in removed:
+                    raise ValueError("Player {0} has recorded matches"
+                                     .format(winner if winner in removed
+                                             else loser))
+        for player_id in removed:
+            del self.players[player_id]
+            self.ratings.pop(player_id, None)
+            for state in self.tourneys.values():
+                state.players.pop(player_id, None)
+
+    def deleteTournaments(self, tourney=None):
+        if tourney is None:
+            self.tourneys.clear()
+        else:
+            self.tourneys.pop(tourney, None)
+        self.deletePlayers("clear")
+
+    def purgeTournaments(self, tourneys, archive=True, batch_size=500,
+                         progress=None):
+        tourneys = list(tourneys)
+        removed = 0
+        for start in range(0, len(tourneys), batch_size):
+            for tourney_id in tourneys[start:start + batch_size]:
+                state = self.tourneys.pop(tourney_id, None)
+                if state is None:
+                    continue
+                if archive:
+                    self.archived_standings.extend(
+                        (tourney_id, state.name) + row
+                        for row in state.standings())
+                    self.archived_matches.extend(
+                        (match_id, tourney_id, player_id, outcome)
+                        for (match_id, player_id, opponent, outcome)
+                        in state.outcomes())
+                removed += 1
+            if progress is not None:
+                progress(min(start + batch_size, len(tourneys)),
+                         len(tourneys))
+        self.deletePlayers("clear")
+        return removed
+
+    def countPlayers(self, tourney=None):
+        if tourney is not None:
+            return sum(len(state.players) for state in self._select(tourney))
+        return len(self.players)
+
+    def registerPlayer(self, player, tourney="free agent"):
+        if isinstance(player, int):
+            if player not in self.players:
+                raise ValueError("Unknown player {0}".format(player))
+            player_id = player
+        else:
+            player_id = next(self._player_ids)
+            self.players[player_id] = str(player)
+        self._enter(self._findTournament(tourney), player_id)
+        return player_id
+
+    def registerPlayers(self, names, tourney="free agent"):
+        names = [str(name) for name in names]
+        if not names:
+            return []
+        state = self._findTournament(tourney)
+        players = []
+        for name in names:
+            player_id = next(self._player_ids)
+            self.players[player_id] = name
+            self._enter(state, player_id)
+            players.append((player_id, name))
+        return players
+
+    def playerStandings(self, player=None, detail=False):
+        return _playerStandings(self.tourneys.values(), player, detail)
+
+    def tournamentStandings(self, tourney=None, detail=False):
+        if detail == "tiebreaks":
+            results = {}
+            for (tourney_id, state) in self._items(tourney):
+                results[tourney_id] = state.results()
+            return _addTiebreaks(self.tournamentStandings(tourney, True),
+                                 results)
+        return _tournamentStandings(self._items(tourney), tourney, detail)
+
+    def iterPlayerStandings(self, player=None, detail=False,
+                            fetch_size=None):
+        return iter(self.playerStandings(player, detail))
+
+    def iterTournamentStandings(self, tourney=None, detail=False,
+                                fetch_size=None):
+        if detail == "tiebreaks":
+            raise ValueError("Tiebreak standings can not be streamed")
+        return iter(self.tournamentStandings(tourney, detail))
+
+    def pastPairings(self, tourney=None):
+        pairings = []
+        for (tourney_id, state) in self._items(tourney):
+            for (match_id, winner, loser, tied) in state.matches:
+                if loser is None:
+                    continue
+                if tied:
+                    (winner, loser) = (min(winner, loser), max(winner, loser))
+                pairings.append((tourney_id, winner, self.players[winner],
+                                 loser, self.players[loser]))
+        return pairings
+
+    def reportMatch(self, winner, loser, tourney=None, tied=False):
+        if tourney is None:
+            tourney = self.getLatestTournament()
+        self.reportRound(tourney, [(winner, loser, tied)])
+
+    def reportRound(self, tourney, results):
+        results = [tuple(result) for result in results]
+        state = self._state(tourney)
+        missing = set()
+        for (winner, loser, tied) in results:
+            missing.update(player for player in (winner, loser)
+                           if player is not None and
+                           player not in state.players)
+        if missing:
+            raise ValueError("Players {0} are not registered to tournament "
+                             "{1}".format(sorted(missing), tourney))
+        for (winner, loser, tied) in results:
+            state.record(winner, loser, tied)
+            state.matches.append((next(self._match_ids), winner, loser,
+                                  bool(tied)))
+        updateRatings(self.ratings, results)
+
+    def rebuildStandings(self, tourney=None, repair=True):
+        """Records are always worked out from the matches in memory, so
+        there is never anything to rebuild"""
+        return []
+
+    def rebuildPairings(self, tourney=None):
+        indexed = 0
+        for (tourney_id, state) in self._items(tourney):
+            state.pairings = set((min(winner, loser), max(winner, loser))
+                                 for (match_id, winner, loser, tied)
+                                 in state.matches if loser is not None)
+            indexed += len(state.pairings)
+        return indexed
+
+    def rebuildRatings(self, fetch_size=None):
+        self.ratings.clear()
+        matches = merge(*[state.matches for state in self.tourneys.values()])
+        updateRatings(self.ratings, (match[1:] for match in matches))
+        return len(self.ratings)
+
+    def leaderboard(self, top=10):
+        best = nlargest(top, self.ratings.items(),
+                        key=lambda item: (item[1][0], -item[0]))
+        return [(player_id, self.players[player_id], rating, matches)
+                for (player_id, (rating, matches)) in best]
+
+    def createTournament(self, name):
+        tourney_id = next(self._tourney_ids)
+        self.tourneys[tourney_id] = _MemoryTourney(str(name))
+        return tourney_id
+
+    def getLatestTournament(self):
+        if not self.tourneys:
+            return self.createTournament("Open Tournament")
+        return max(self.tourneys)
+
+    def pairingSnapshot(self, tourney=None):
+        if tourney is None:
+            tourney = self.getLatestTournament()
+        state = self._state(tourney)
+        field = PairingField((player_id, name, matches, wins, ties)
+                             for (player_id, name, matches, wins, loses, ties)
+                             in state.standings())
+        return tourney, field, set(state.pairings), set(state.byes)
+
+    def swissPairings(self, tourney=None, strategy="random", **options):
+        if strategy not in PAIRING_STRATEGIES:
+            raise ValueError("Unknown pairing strategy {0!r}"
+                             .format(strategy))
+        tourney, field, past_pairings, byes = self.pairingSnapshot(tourney)
+        pairings, bye = _nextRound(field, past_pairings, byes, strategy,
+                                   **options)
+        if bye:
+            self.reportMatch(bye, None, tourney, False)
+        return pairings
+
+    def _findTournament(self, tourney):
+        """Returns the state of the tournament to register players to, see
+        tournament._findTournament"""
+        if isinstance(tourney, int):
+            return self._state(tourney)
+        if tourney.lower() == "free agent":
+            return self._state(self.getLatestTournament())
+        return self._state(self.createTournament(tourney))
+
+    def _enter(self, state, player_id):
+        """Registers a player to a tournament with an empty record"""
+        if player_id in state.players:
+            raise ValueError("Player {0} is already registered"
+                             .format(player_id))
+        state.players[player_id] = [self.players[player_id], 0, 0, 0, 0]
+
+    def _state(self, tourney):
+        """Returns the state of a tournament, for changing it. Raises
+        ValueError for an unknown tournament, as PostgreSQL refuses to
+        record anything for one"""
+        if tourney not in self.tourneys:
+            raise ValueError("Unknown tournament {0}".format(tourney))
+        return self.tourneys[tourney]
+
+    def _select(self, tourney):
+        """Returns the states of one tournament, or all if tourney is
+        None"""
+        return [state for (tourney_id, state) in self._items(tourney)]
+
+    def _items(self, tourney):
+        """Returns (tourney_id, state) of one tournament, or all of them in
+        id order if tourney is None. Unknown tournaments have no states,
+        as PostgreSQL finds no rows for them"""
+        if tourney is None:
+            return sorted(self.tourneys.items())
+        if tourney not in self.tourneys:
+            return []
+        return [(tourney, self.tourneys[tourney])]
+
+
+class _MemoryTourney(_TourneyState):
+    """Tournament state as kept by TournamentEngine, plus every match in
+    the order reported as (match_id, winner, loser, tied)"""
+    __slots__ = ('matches',)
+
+    def __init__(self, name):
+        super(_MemoryTourney, self).__init__(name)
+        self.matches = []
+
+    def results(self):
+        """Returns a (player_id, opponent_id, outcome) row for each player
+        in each match, as read from Match_Players"""
+        return [row[1:] for row in self.outcomes()]
+
+    def outcomes(self):
+        """Returns a (match_id, player_id, opponent_id, outcome) row for
+        each player in each match"""
+        rows = []
+        for (match_id, winner, loser, tied) in self.matches:
+            if tied:
+                rows.append((match_id, winner, loser, 'tie'))
+            else:
+                rows.append((match_id, winner, loser, 'bye' if loser is None
+                             else 'win'))
+            if loser is not None:
+                rows.append((match_id, loser, winner,
+                             'tie' if tied else 'loss'))
+        return rows
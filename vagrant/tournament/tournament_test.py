@@ -8,7 +8,20 @@
 # Created:      13-11-2015
 # ------------------------------------------------------------------------------
 
+import io
+import json
+import time
+import logging
 from tournament import *
+from matching import maxWeightMatching
+from threading import Barrier
+from threading import BrokenBarrierError
+from threading import Thread
+from tournament_engine import TournamentEngine
+from tournament_memory import MemoryBackend
+from tournament_export import exportStandings
+from tournament_export import standingsColumns
+from metrics import Metrics
 
 # Test functions below will always delete previous database information
 # and test different functions of tournament.py on a clean database
@@ -156,6 +169,838 @@ def testPairings():
     print ("9. After one match, players with one win are paired.")
 
 
+def testConnectionPool():
+    """Test to see if connect hands out pooled connections correctly"""
+    with connect() as outer:
+        with connect() as inner:
+            if outer is not inner:
+                raise ValueError(
+                    "Nested connect() calls should share one connection.")
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Tom Bombadil")
+    registerPlayer("Goldberry")
+    errors = []
+
+    # Reads from more threads than there are pooled connections
+    def count():
+        try:
+            for i in range(5):
+                if countPlayers() != 2:
+                    raise ValueError("Every thread should count 2 players.")
+        except Exception as e:
+            errors.append(e)
+    threads = [Thread(target=count) for n in range(POOL_MAX * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    print ("10. Pooled connections are shared safely between threads.")
+
+
+def testStandingsRecords():
+    """Test to see if running totals in Records match every recorded match
+       and can be rebuilt when they do not"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Ford Prefect", "Records Tournament")
+    tourney_id = getLatestTournament()
+    registerPlayer("Arthur Dent", tourney_id)
+    registerPlayer("Zaphod Beeblebrox", tourney_id)
+    registerPlayer("Trillian", tourney_id)
+    [id1, id2, id3, id4] = [row[0] for row in tournamentStandings(tourney_id)]
+    reportMatch(id1, id2, tourney_id)
+    reportMatch(id3, id4, tourney_id, True)
+    reportMatch(id1, None, tourney_id)
+    if rebuildStandings(tourney_id, repair=False) != []:
+        raise ValueError("Records should match the calculated standings.")
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("UPDATE Records SET wins = 7 WHERE player_id = %s;",
+                       [id2])
+    if len(rebuildStandings(tourney_id)) != 1:
+        raise ValueError("rebuildStandings should find one changed record.")
+    if rebuildStandings(tourney_id, repair=False) != []:
+        raise ValueError("Records should be correct after rebuilding.")
+    deleteMatches(tourney_id)
+    for (i, n, m, w, t) in tournamentStandings(tourney_id):
+        if m != 0 or w != 0 or t != 0:
+            raise ValueError("Deleting matches should reset player records.")
+    print ("11. Player records stay in step with matches and can be rebuilt.")
+
+
+def testReportRound():
+    """Test to see if reportRound records a whole round, or nothing at all
+       when a result is invalid"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Rincewind", "Round Tournament")
+    tourney_id = getLatestTournament()
+    registerPlayer("Twoflower", tourney_id)
+    registerPlayer("Cohen", tourney_id)
+    registerPlayer("The Luggage", tourney_id)
+    registerPlayer("Death", "Other Tournament")
+    outsider = getLatestTournament()
+    [id1, id2, id3, id4] = [row[0] for row in tournamentStandings(tourney_id)]
+    [(id5, n, m, w, t)] = tournamentStandings(outsider)
+    try:
+        reportRound(tourney_id, [(id1, id2, False), (id3, id5, False)])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("reportRound should refuse players from another "
+                         "tournament.")
+    for (i, n, m, w, t) in tournamentStandings(tourney_id):
+        if m != 0:
+            raise ValueError("A refused round should record no matches.")
+    reportRound(tourney_id, [(id1, id2, False), (id3, id4, True)])
+    for (i, n, m, w, t) in tournamentStandings(tourney_id):
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+        if (i == id1 and w != 1) or (i in (id3, id4) and t != 1):
+            raise ValueError("Each result in the round should be recorded.")
+    print ("12. A whole round can be reported at once.")
+
+
+def testRegisterPlayers():
+    """Test to see if registerPlayers registers many players at once and
+       returns their ids"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    names = ["Entrant {0}".format(n) for n in range(1000)]
+    registered = registerPlayers(names, "Open Tournament")
+    tourney_id = getLatestTournament()
+    if [name for (i, name) in registered] != names:
+        raise ValueError("registerPlayers should return players in order.")
+    if countPlayers(tourney_id) != 1000:
+        raise ValueError(
+            "After registering 1000 players, countPlayers should be 1000.")
+    standings = dict((i, n) for (i, n, m, w, t)
+                     in tournamentStandings(tourney_id))
+    if standings != dict(registered):
+        raise ValueError("Each returned id should belong to its player.")
+    print ("13. Many players can be registered at once.")
+
+
+def testMaxWeightMatching():
+    """Test to see if maxWeightMatching finds the heaviest matching"""
+    # A triangle 0-1-2 with a tail 2-3: the heaviest matching takes the
+    # lighter edge 0-1 so that 2-3 can also be matched
+    edges = [(0, 1, 5), (1, 2, 8), (0, 2, 6), (2, 3, 4)]
+    if maxWeightMatching(edges) != [1, 0, 3, 2]:
+        raise ValueError("maxWeightMatching should pair 0-1 and 2-3.")
+    # Two heavy edges share vertex 1 so only one can be used, unless every
+    # vertex must be matched
+    edges = [(0, 1, 10), (1, 2, 10), (0, 3, 1), (2, 3, 1)]
+    if maxWeightMatching(edges)[1] == -1:
+        raise ValueError("maxWeightMatching should use a heavy edge.")
+    if -1 in maxWeightMatching(edges, maxcardinality=True):
+        raise ValueError("maxcardinality should match every vertex.")
+    print ("14. maxWeightMatching finds the heaviest matching.")
+
+
+def testMatchingPairings():
+    """Test to see if the matching strategy of swissPairings pairs winners
+       together and never repeats a matchup"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Vimes", "Matching Tournament")
+    tourney_id = getLatestTournament()
+    for name in ["Carrot", "Angua", "Nobby", "Colon", "Cheery"]:
+        registerPlayer(name, tourney_id)
+    [id1, id2, id3, id4, id5, id6] = [row[0] for row
+                                      in tournamentStandings(tourney_id)]
+    reportRound(tourney_id, [(id1, id2, False), (id3, id4, False),
+                             (id5, id6, False)])
+    pairings = swissPairings(tourney_id, "matching")
+    if pairings != swissPairings(tourney_id, "matching"):
+        raise ValueError("The matching strategy should be deterministic.")
+    actual_pairs = set(frozenset([p[0], p[2]]) for p in pairings)
+    if len(actual_pairs) != 3:
+        raise ValueError(
+            "For six players, swissPairings should return three pairs.")
+    if actual_pairs & set([frozenset([id1, id2]), frozenset([id3, id4]),
+                           frozenset([id5, id6])]):
+        raise ValueError("Players should not be paired with a past opponent.")
+    winners = set([id1, id3, id5])
+    mixed = [pair for pair in actual_pairs if len(pair & winners) == 1]
+    if len(mixed) != 1:
+        raise ValueError("Only one pair should mix winners and losers.")
+    print ("15. The matching strategy pairs players with no rematches.")
+
+
+def testPairingsIndex():
+    """Test to see if past matchups are indexed once per pair of players
+       whichever order they were reported in"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Granny Weatherwax", "Pairings Tournament")
+    tourney_id = getLatestTournament()
+    registerPlayer("Nanny Ogg", tourney_id)
+    registerPlayer("Magrat Garlick", tourney_id)
+    [id1, id2, id3] = [row[0] for row in tournamentStandings(tourney_id)]
+    reportMatch(id1, id2, tourney_id)
+    reportMatch(id2, id1, tourney_id)
+    reportMatch(id3, None, tourney_id)
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SELECT id_low, id_high FROM Pairings "
+                       "WHERE tourney_id = %s;", [tourney_id])
+        indexed = cursor.fetchall()
+    if indexed != [(min(id1, id2), max(id1, id2))]:
+        raise ValueError("A matchup should be indexed once, lowest id first.")
+    if rebuildPairings(tourney_id) != 1:
+        raise ValueError("Rebuilding should index the same single matchup.")
+    deleteMatches(tourney_id)
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Pairings "
+                       "WHERE tourney_id = %s;", [tourney_id])
+        if cursor.fetchone()[0] != 0:
+            raise ValueError("Deleting matches should forget past pairings.")
+    print ("16. Past matchups are indexed by pair of player ids.")
+
+
+def testTournamentEngine():
+    """Test to see if the engine pairs and records rounds in memory, only
+       saving them to the database when flushed"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayers(["Vimes", "Carrot", "Angua", "Nobby", "Colon"],
+                    "Engine Tournament")
+    tourney_id = getLatestTournament()
+    engine = TournamentEngine([tourney_id], batch_size=1000)
+    for round_no in range(2):
+        pairings = engine.swissPairings(tourney_id)
+        engine.reportRound(tourney_id, [(id1, id2, False) for
+                                        (id1, n1, id2, n2) in pairings])
+    for (i, n, m, w, t) in tournamentStandings(tourney_id):
+        if m != 0:
+            raise ValueError("Results should not be saved before a flush.")
+    if engine.flush() != 6:
+        raise ValueError("Flush should save 4 matches and 2 byes.")
+    if (sorted(engine.tournamentStandings(tourney_id)) !=
+            sorted(tournamentStandings(tourney_id))):
+        raise ValueError("Saved standings should match those in memory.")
+    reloaded = TournamentEngine([tourney_id])
+    if (reloaded.tournamentStandings(tourney_id, True) !=
+            engine.tournamentStandings(tourney_id, True)):
+        raise ValueError("A reloaded engine should have the same standings.")
+    lazy = TournamentEngine([])
+    if (lazy.tournamentStandings(tourney_id, True) !=
+            engine.tournamentStandings(tourney_id, True)):
+        raise ValueError("Tournaments should be loaded when first used.")
+    engine.close()
+    reloaded.close()
+    lazy.close()
+    print ("17. Tournaments can be run in memory and saved in batches.")
+
+
+def testAsyncApi():
+    """Test to see if tournament_async registers, reports, pairs and reads
+       standings the same way as tournament.py"""
+    import asyncio
+    try:
+        import tournament_async
+    except ImportError:
+        print ("18. Skipped async API test, asyncpg is not installed.")
+        return
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    registerPlayer("Mustrum Ridcully", "Async Tournament")
+    tourney_id = getLatestTournament()
+
+    async def run():
+        names = ["Ponder Stibbons", "The Librarian", "The Bursar"]
+        await asyncio.gather(*[tournament_async.registerPlayer(name,
+                                                               tourney_id)
+                               for name in names])
+        if await tournament_async.countPlayers(tourney_id) != 4:
+            raise ValueError("Players registered at once should all be "
+                             "counted.")
+        pairings = await tournament_async.swissPairings(tourney_id)
+        await asyncio.gather(*[tournament_async.reportMatch(id1, id2,
+                                                            tourney_id)
+                               for (id1, n1, id2, n2) in pairings])
+        standings = await tournament_async.tournamentStandings(tourney_id)
+        await tournament_async.closePool()
+        return standings
+
+    standings = asyncio.run(run())
+    if sorted(standings) != sorted(tournamentStandings(tourney_id)):
+        raise ValueError("Async standings should match tournament.py.")
+    if sorted(w for (i, n, m, w, t) in standings) != [0, 0, 1, 1]:
+        raise ValueError("Each async pairing should record one winner.")
+    print ("18. The async API records matches like tournament.py.")
+
+
+def testQueryPlans(num_matches=1000000, num_tourneys=500):
+    """Test to see if standings, past pairings and bye queries for one
+       tournament or player use indexes instead of scanning whole tables
+       once the database holds many matches
+
+       Args:
+            num_matches: number of matches to fill the database with
+            num_tourneys: number of 64 player tournaments sharing them
+    """
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    names = ["Plan Player {0}".format(n) for n in range(num_tourneys * 64)]
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("INSERT INTO Tourneys (name) SELECT 'Plan Tournament '"
+                       " || n FROM generate_series(1, %s) AS n RETURNING id;",
+                       [num_tourneys])
+        tourney_ids = sorted(row[0] for row in cursor.fetchall())
+        for (number, tourney_id) in enumerate(tourney_ids):
+            registerPlayers(names[number * 64:(number + 1) * 64], tourney_id)
+
+        # Every tournament plays its share of matches, each player against
+        # a different opponent every 64 matches
+        cursor.execute("WITH results AS (SELECT nextval('matches_id_seq') "
+                       "AS id, tourney_id, players[1 + n %% 64] AS winner, "
+                       "players[1 + (n + 1 + (n / 64) %% 63) %% 64] AS loser "
+                       "FROM (SELECT tourney_id, array_agg(player_id "
+                       "ORDER BY player_id) AS players FROM Contestants "
+                       "GROUP BY tourney_id) AS field, "
+                       "generate_series(0, %s) AS n), "
+                       "new_matches AS (INSERT INTO Matches (id, tourney_id) "
+                       "SELECT id, tourney_id FROM results) "
+                       "INSERT INTO Match_Players (match_id, tourney_id, "
+                       "player_id, outcome) SELECT id, tourney_id, winner, "
+                       "'win' FROM results UNION ALL SELECT id, tourney_id, "
+                       "loser, 'loss' FROM results;",
+                       [num_matches // num_tourneys - 1])
+        cursor.execute("ANALYZE;")
+        rebuildPairings()
+        cursor.execute("ANALYZE Pairings;")
+        tourney_id = tourney_ids[num_tourneys // 2]
+        [(player_id, n, m, w, t)] = tournamentStandings(tourney_id)[:1]
+        queries = [
+            ("SELECT * FROM Standings WHERE tourney_id = %s;", tourney_id),
+            ("SELECT * FROM Standings WHERE player_id = %s;", player_id),
+            ("SELECT * FROM Computed_Standings WHERE tourney_id = %s;",
+             tourney_id),
+            ("SELECT * FROM Past_Pairings WHERE tourney_id = %s;",
+             tourney_id),
+            ("SELECT id_low, id_high FROM Pairings WHERE tourney_id = %s;",
+             tourney_id),
+            ("SELECT player_id FROM Match_Players WHERE tourney_id = %s "
+             "AND outcome = 'bye';", tourney_id)]
+        for (query, query_add) in queries:
+            scanned = seqScans(cursor, query, [query_add])
+            if scanned & set(["matches", "match_players", "pairings",
+                              "records", "contestants"]):
+                raise ValueError("{0} scans all of {1}.".format(
+                    query, ", ".join(sorted(scanned))))
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    print ("19. Tournament queries use indexes with {0} matches."
+           .format(num_matches))
+
+
+def seqScans(cursor, query, query_add):
+    """Returns the names of tables read by a sequential scan in the plan
+       of a query, found with EXPLAIN
+
+       Args:
+            cursor: cursor of an open connection
+            query: the query to explain
+            query_add: arguments for the query
+
+       Returns:
+            A set of table names (in lower case)
+    """
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, query_add)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]["Plan"]]
+    scanned = set()
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scanned.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return scanned
+
+
+def testTiebreaks():
+    """Test to see if tiebreaks are calculated from opponents' scores and
+       used to order players on equal wins"""
+    try:
+        from tiebreaks import computeTiebreaks
+    except ImportError:
+        print ("20. Skipped tiebreaks test, NumPy is not installed.")
+        return
+    results = [(1, 2, 'win'), (2, 1, 'loss'), (3, 4, 'tie'), (4, 3, 'tie'),
+               (1, 3, 'win'), (3, 1, 'loss'), (2, 4, 'win'), (4, 2, 'loss'),
+               (5, None, 'bye'), (5, 1, 'loss'), (1, 5, 'win')]
+    expected = {1: (2.5, 1.0, 2.5, 4.0 / 9), 2: (3.5, 3.5, 0.5, 2.0 / 3),
+                3: (3.5, 3.5, 0.25, 2.0 / 3), 4: (1.5, 1.5, 0.25, 5.0 / 12),
+                5: (3.0, 3.0, 0.0, 1.0)}
+    tiebreaks = computeTiebreaks(results)
+    for (player, values) in expected.items():
+        if any(abs(a - b) > 1e-9
+               for (a, b) in zip(tiebreaks[player], values)):
+            raise ValueError("Tiebreaks of player {0} should be {1}, not "
+                             "{2}.".format(player, values, tiebreaks[player]))
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    players = registerPlayers(["Susan", "Lobsang", "Lu-Tze", "Mrs Cake"],
+                              "Tiebreak Tournament")
+    tourney_id = getLatestTournament()
+    [id1, id2, id3, id4] = [player_id for (player_id, name) in players]
+    reportRound(tourney_id, [(id1, id2, False), (id4, id3, False)])
+    reportRound(tourney_id, [(id1, id4, False), (id3, id2, False)])
+
+    # Lu-Tze and Mrs Cake both have one win, Mrs Cake lost to the leader
+    standings = tournamentStandings(tourney_id, "tiebreaks")
+    if len(standings[0]) != 12:
+        raise ValueError("Tiebreak standings should add four columns.")
+    if [row[2] for row in standings] != [id1, id4, id3, id2]:
+        raise ValueError("Players on equal wins should be ordered by "
+                         "tiebreaks.")
+    print ("20. Standings can be ordered by opponent tiebreaks.")
+
+
+def testRatings():
+    """Test to see if ratings are updated with each reported match, match a
+       full rebuild and rank the leaderboard"""
+    from ratings import updateRatings
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    players = registerPlayers(["Moist von Lipwig", "Adora Belle", "Vetinari"],
+                              "Rated Tournament")
+    tourney_id = getLatestTournament()
+    [id1, id2, id3] = [player_id for (player_id, name) in players]
+    results = [(id1, id2, False), (id3, None, False), (id1, id3, False),
+               (id2, id3, True)]
+    for (winner, loser, tied) in results:
+        reportMatch(winner, loser, tourney_id, tied)
+    expected = {}
+    updateRatings(expected, results)
+    board = leaderboard()
+    if [row[0] for row in board] != sorted(expected, key=lambda player:
+                                           -expected[player][0]):
+        raise ValueError("The leaderboard should be ordered by rating.")
+    for (player_id, name, rating, matches) in board:
+        if (abs(rating - expected[player_id][0]) > 1e-9 or
+                matches != expected[player_id][1]):
+            raise ValueError("Ratings should be updated with each match.")
+    if [row[3] for row in board if row[0] == id3] != [2]:
+        raise ValueError("A bye should not be rated.")
+    if leaderboard(1) != board[:1]:
+        raise ValueError("The leaderboard should return only the top rows.")
+    if rebuildRatings(fetch_size=1) != 3 or leaderboard() != board:
+        raise ValueError("Rebuilt ratings should match incremental ones.")
+
+    # Rounds of two tournaments reported at once for a player's first rated
+    # matches should both count. The metrics hook holds each round after
+    # reading Ratings until the other has too, unless it is kept waiting
+    # for the other to finish first
+    other_id = createTournament("Second Rated Tournament")
+    [(id1, n1), (id2, n2)] = registerPlayers(["Rincewind", "Twoflower"],
+                                             tourney_id)
+    id3 = registerPlayer("Luggage", other_id)
+    registerPlayer(id1, other_id)
+    both_read = Barrier(2, timeout=1)
+
+    def hook(event, name, value):
+        if event == "query" and "FROM Ratings" in name and "FOR UPDATE" in name:
+            try:
+                both_read.wait()
+            except BrokenBarrierError:
+                pass
+    threads = [Thread(target=reportRound, args=(tourney, [(id1, opponent,
+                                                           False)]))
+               for (tourney, opponent) in ((tourney_id, id2), (other_id, id3))]
+    setMetrics(hook)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        setMetrics(None)
+    if [row[3] for row in leaderboard(1000) if row[0] == id1] != [2]:
+        raise ValueError("Rounds reported at once for new players should "
+                         "both be rated.")
+    print ("21. Ratings are kept up to date for the leaderboard.")
+
+
+def testMemoryBackend():
+    """Test to see if the in memory backend gives the same standings and
+       past pairings as PostgreSQL for the same matches"""
+    def playScript():
+        deleteMatches()
+        deletePlayers()
+        deleteTournaments()
+        names = ["Tiffany Aching", "Rob Anybody", "Miss Tick", "Roland",
+                 "Annagramma"]
+        players = dict((name, player_id) for (player_id, name)
+                       in registerPlayers(names, "Backend Tournament"))
+        tourney_id = getLatestTournament()
+        reportRound(tourney_id, [
+            (players["Tiffany Aching"], players["Rob Anybody"], False),
+            (players["Miss Tick"], players["Roland"], True),
+            (players["Annagramma"], None, False)])
+        reportMatch(players["Roland"], players["Tiffany Aching"], tourney_id)
+        reportMatch(players["Rob Anybody"], players["Annagramma"],
+                    tourney_id, True)
+
+        # Ids differ between backends so compare names and records. An
+        # unknown tournament has no players, standings or past pairings
+        unknown = tourney_id + 1000000
+        return (countPlayers(tourney_id),
+                (countPlayers(unknown), tournamentStandings(unknown),
+                 tournamentStandings(unknown, True),
+                 tournamentStandings(unknown, "tiebreaks"),
+                 pastPairings(unknown)),
+                sorted(row[1:2] + row[3:] for row in
+                       tournamentStandings(tourney_id, True)),
+                sorted(row[1:] for row in playerStandings(None, True)),
+                sorted((row[2], row[4]) for row in pastPairings(tourney_id)))
+
+    expected = playScript()
+    useBackend(MemoryBackend())
+    try:
+        found = playScript()
+        tourney_id = getLatestTournament()
+        pairings = swissPairings(tourney_id, "matching")
+        while pairings not in ([], [None]):
+            reportRound(tourney_id, [(id1, id2, False) for
+                                     (id1, n1, id2, n2) in pairings])
+            pairings = swissPairings(tourney_id, "matching")
+    finally:
+        useBackend(None)
+    if found != expected:
+        raise ValueError("The memory backend should match PostgreSQL:\n{0}"
+                         "\n{1}".format(found, expected))
+    print ("22. Tournaments can be run in memory without PostgreSQL.")
+
+
+def testMonteCarloPairings():
+    """Test to see if the montecarlo strategy of swissPairings keeps to
+       its budget, pairs winners together and never repeats a matchup"""
+    useBackend(MemoryBackend())
+    try:
+        names = ["Rincewind", "Twoflower", "Cohen", "Luggage", "Ridcully",
+                 "Ponder", "Librarian"]
+        players = [player_id for (player_id, name)
+                   in registerPlayers(names, "Monte Carlo Tournament")]
+        tourney_id = getLatestTournament()
+        [id1, id2, id3, id4, id5, id6, id7] = players
+        reportRound(tourney_id, [(id1, id2, False), (id3, id4, False),
+                                 (id5, id6, False), (id7, None, False)])
+        start = time.time()
+        pairings = swissPairings(tourney_id, "montecarlo", budget=0.2,
+                                 workers=2)
+        elapsed = time.time() - start
+        standings = tournamentStandings(tourney_id)
+    finally:
+        useBackend(None)
+    actual_pairs = set(frozenset([p[0], p[2]]) for p in pairings)
+    if len(actual_pairs) != 3:
+        raise ValueError(
+            "For seven players, swissPairings should return three pairs.")
+    if actual_pairs & set([frozenset([id1, id2]), frozenset([id3, id4]),
+                           frozenset([id5, id6])]):
+        raise ValueError("Players should not be paired with a past opponent.")
+    if [row[3] for row in standings if row[0] == id7] != [1]:
+        raise ValueError("The player with a bye should not get another.")
+    winners = set([id1, id3, id5, id7])
+    mixed = [pair for pair in actual_pairs if len(pair & winners) == 1]
+    if mixed:
+        raise ValueError("With a loser given the bye, winners should only "
+                         "be paired with winners.")
+    if elapsed > 5:
+        raise ValueError("Pairing should stop soon after the budget.")
+    print ("23. The montecarlo strategy pairs players within its budget.")
+
+
+def testPairingSnapshot():
+    """Test to see if the pairing snapshot reads the same standings, past
+       matchups and byes as separate queries, in one REPEATABLE READ
+       transaction"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    names = ["Moist von Lipwig", "Adora Belle", "Gladys", "Stanley",
+             "Reacher Gilt"]
+    [id1, id2, id3, id4, id5] = [player_id for (player_id, name) in
+                                 registerPlayers(names, "Snapshot Tournament")]
+    tourney_id = getLatestTournament()
+    reportRound(tourney_id, [(id1, id2, False), (id3, id4, True),
+                             (id5, None, False)])
+    (found_id, field, past_pairings, byes) = pairingSnapshot()
+    if found_id != tourney_id:
+        raise ValueError("The snapshot should default to the latest "
+                         "tournament.")
+    standings = [field.pairing(spot, spot)[:2] + (field.matches[spot],
+                                                  field.wins[spot],
+                                                  field.ties[spot])
+                 for spot in range(len(field))]
+    if sorted(standings) != sorted(tournamentStandings(tourney_id)):
+        raise ValueError("The snapshot should hold the same standings.")
+    if [row[3] for row in standings] != sorted([row[3] for row in standings],
+                                               reverse=True):
+        raise ValueError("The snapshot should be ranked by wins.")
+    if past_pairings != set([(min(id1, id2), max(id1, id2)),
+                             (min(id3, id4), max(id3, id4))]):
+        raise ValueError("The snapshot should hold every past matchup.")
+    if byes != set([id5]):
+        raise ValueError("The snapshot should hold every bye.")
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SHOW transaction_isolation;")
+        if cursor.fetchone()[0] != "read committed":
+            raise ValueError("Pooled connections should go back to the "
+                             "default isolation level.")
+    print ("24. Pairing reads one consistent snapshot in one round trip.")
+
+
+def testConcurrentRegistration():
+    """Test to see if players and tournaments created from many threads at
+       once are each given back their own id"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tourney_id = createTournament("Check-in Tournament")
+    registered = {}
+    created = {}
+    errors = []
+
+    # More desks than there are pooled connections, each registering
+    # players and opening a tournament of its own
+    def checkIn(desk):
+        try:
+            for n in range(10):
+                name = "Desk {0} Player {1}".format(desk, n)
+                registered[registerPlayer(name, tourney_id)] = name
+            name = "Desk {0} Tournament".format(desk)
+            created[createTournament(name)] = name
+        except Exception as e:
+            errors.append(e)
+    threads = [Thread(target=checkIn, args=(desk,))
+               for desk in range(POOL_MAX * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if len(registered) != POOL_MAX * 20 or len(created) != POOL_MAX * 2:
+        raise ValueError("Every registration should be given a new id.")
+    standings = dict((row[0], row[1]) for row
+                     in tournamentStandings(tourney_id))
+    if standings != registered:
+        raise ValueError("Every id returned should belong to the player "
+                         "registered.")
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SELECT id, name FROM Tourneys WHERE id != %s;",
+                       [tourney_id])
+        if dict(cursor.fetchall()) != created:
+            raise ValueError("Every id returned should belong to the "
+                             "tournament created.")
+    print ("25. Registering from many threads returns the right ids.")
+
+
+def testStreamingExport():
+    """Test to see if streamed standings match the lists returned by the
+       standings functions and are written out as CSV and JSON lines"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    names = ["Sam Vimes", "Sybil Ramkin", "Havelock Vetinari", "Drumknott",
+             "Detritus"]
+    players = registerPlayers(names, "Export Tournament")
+    tourney_id = getLatestTournament()
+    registerPlayers(names[:2], "Second Export Tournament")
+    reportRound(tourney_id, [(players[0][0], players[1][0], False),
+                             (players[2][0], players[3][0], True),
+                             (players[4][0], None, False)])
+    for detail in (False, True):
+        for tourney in (None, tourney_id):
+            if (list(iterTournamentStandings(tourney, detail, 2)) !=
+                    tournamentStandings(tourney, detail)):
+                raise ValueError("Streamed tournament standings should "
+                                 "match tournamentStandings.")
+        if (list(iterPlayerStandings(None, detail, 2)) !=
+                playerStandings(None, detail)):
+            raise ValueError("Streamed player standings should match "
+                             "playerStandings.")
+    rows = iterTournamentStandings(None, False, 2)
+    next(rows)
+    paused_id = createTournament("Paused Export Tournament")
+    rows.close()
+    if getLatestTournament() != paused_id:
+        raise ValueError("Closing a stream early should not roll back "
+                         "writes made while it was paused.")
+    output = io.StringIO(newline="")
+    if exportStandings(output, "csv", detail=True) != 7:
+        raise ValueError("Every contestant should be exported.")
+    lines = output.getvalue().splitlines()
+    if lines[0] != ",".join(standingsColumns(None, True)) or len(lines) != 8:
+        raise ValueError("CSV exports should have a header and a line per "
+                         "contestant.")
+    output = io.StringIO()
+    exportStandings(output, "jsonl", players=True)
+    exported = [json.loads(line) for line in output.getvalue().splitlines()]
+    expected = [dict(zip(("player_id", "name", "matches", "wins"), row))
+                for row in playerStandings()]
+    if exported != expected:
+        raise ValueError("JSON lines exports should have an object per "
+                         "player.")
+    print ("26. Standings are streamed and exported in constant memory.")
+
+
+def testMetrics():
+    """Test to see if calls, queries, connections and pairing attempts are
+       reported to the metrics hook and slow queries are logged"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tourney_id = createTournament("Metrics Tournament")
+    registerPlayers(["Lu-Tze", "Lobsang", "Jeremy", "Susan"], tourney_id)
+    metrics = Metrics(slow_query=0)
+    slow = []
+    handler = logging.Handler()
+    handler.emit = slow.append
+    logging.getLogger("tournament.slow_queries").addHandler(handler)
+    setMetrics(metrics)
+    try:
+        closePool()
+        pairings = swissPairings(tourney_id)
+        reportRound(tourney_id, [(id1, id2, False)
+                                 for (id1, n1, id2, n2) in pairings])
+        reportMatch(pairings[0][0], pairings[1][0], tourney_id)
+    finally:
+        setMetrics(None)
+        logging.getLogger("tournament.slow_queries").removeHandler(handler)
+    calls = metrics.stats["call"]
+    if calls["swissPairings"]["count"] != 1 or "pairingSnapshot" not in calls:
+        raise ValueError("Every public call should be timed.")
+    if metrics.stats["query"][SNAPSHOT_QUERY]["count"] != 1:
+        raise ValueError("Every query should be timed.")
+    queries = metrics.stats["query"]
+    if not all(isinstance(query, str) for query in queries):
+        raise ValueError("Queries should be reported as written.")
+    if max(totals["count"] for totals in queries.values()) < 2:
+        raise ValueError("Repeated queries should be totalled together.")
+    if metrics.stats["checkout"]["pool"]["count"] < 1:
+        raise ValueError("Borrowed connections should be counted.")
+    if metrics.stats["connect"]["open"]["count"] < 1:
+        raise ValueError("Opened connections should be counted.")
+    if (metrics.stats["pairing"]["random"]["count"] != 1 or
+            metrics.stats["attempts"]["random"]["total"] < 1):
+        raise ValueError("Pairing time and attempts should be reported.")
+    if len(slow) != sum(totals["count"] for totals
+                        in metrics.stats["query"].values()):
+        raise ValueError("Queries over the slow query time should be "
+                         "logged.")
+    registerPlayer("Marco Soto", tourney_id)
+    if metrics.stats["call"].get("registerPlayer"):
+        raise ValueError("Nothing should be reported once the hook is "
+                         "removed.")
+    print ("27. Calls, queries, connections and pairing attempts are "
+           "reported to metrics.")
+
+
+def testPurgeTournaments():
+    """Test to see if purging tournaments archives their standings and
+       matches and removes them, and players left in no tournament, in one
+       transaction"""
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("DELETE FROM Archived_Standings;")
+        cursor.execute("DELETE FROM Archived_Matches;")
+    tourneys = [createTournament("Season Tournament {0}".format(n))
+                for n in range(5)]
+    for tourney_id in tourneys:
+        [(id1, name1), (id2, name2)] = registerPlayers(["Mort", "Ysabell"],
+                                                       tourney_id)
+        reportMatch(id1, id2, tourney_id)
+    registerPlayer(id1, createTournament("Next Season Tournament"))
+    done = []
+    if purgeTournaments(tourneys, batch_size=2,
+                        progress=lambda *step: done.append(step)) != 5:
+        raise ValueError("Every tournament given should be purged.")
+    if done != [(2, 5), (4, 5), (5, 5)]:
+        raise ValueError("Progress should be reported after each batch.")
+    if countPlayers() != 1 or len(tournamentStandings()) != 1:
+        raise ValueError("Only the player still registered should be kept.")
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SELECT COUNT(*), SUM(wins) FROM Archived_Standings;")
+        if cursor.fetchone() != (10, 5):
+            raise ValueError("Final standings should be archived.")
+        cursor.execute("SELECT COUNT(*) FROM Archived_Matches "
+                       "WHERE tourney_id = ANY(%s);", [tourneys])
+        if cursor.fetchone()[0] != 10:
+            raise ValueError("Every match outcome should be archived.")
+        cursor.execute("SELECT COUNT(*) FROM Match_Players;")
+        if cursor.fetchone()[0] != 0:
+            raise ValueError("Purged matches should be removed.")
+    print ("28. Tournaments are archived and purged in bulk.")
+
+
+def testPartitions():
+    """Test to see if deleting every tournament in a range of tourney ids
+       drops its partitions, when migrations/007_partition_by_tourney.sql
+       has been run"""
+    with connect() as tourney_db:
+        cursor = tourney_db.cursor()
+        cursor.execute("SELECT to_regproc('drop_tourney_partitions');")
+        partitioned = cursor.fetchone()[0] is not None
+    if not partitioned:
+        print ("29. Skipped partition test, tables are not partitioned.")
+        return
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tourney_id = createTournament("Partitioned Tournament")
+    [(id1, name1), (id2, name2)] = registerPlayers(["Carrot", "Angua"],
+                                                   tourney_id)
+    reportMatch(id1, id2, tourney_id)
+
+    def partition():
+        with connect() as tourney_db:
+            cursor = tourney_db.cursor()
+            cursor.execute("SELECT to_regclass('matches_' || "
+                           "(%s / tourney_partition_width()) * "
+                           "tourney_partition_width());", [tourney_id])
+            return cursor.fetchone()[0]
+    if partition() is None or len(tournamentStandings(tourney_id)) != 2:
+        raise ValueError("A new tournament should have its partitions.")
+    deleteTournaments(tourney_id)
+    if partition() is not None:
+        raise ValueError("Deleting every tournament in a range should drop "
+                         "its partitions.")
+    if countPlayers() != 0:
+        raise ValueError("Players should be removed with the tournament.")
+    print ("29. Whole ranges of tournaments are removed by dropping "
+           "partitions.")
+
+
 def testSmallTournament(ties=False):
     """Simulates a 16 player tournament to test functionality
 
@@ -186,11 +1031,12 @@ def testSmallTournament(ties=False):
     printTournamentStandings(tourney_id)
 
 
-def testLargeTournament(ties=False):
+def testLargeTournament(ties=False, strategy="random"):
     """Simulates a 64 player tournament to test functionality
 
        Args:
             ties: True allows possible random ties. Default False
+            strategy: swissPairings strategy to use. Default "random"
     """
     deleteMatches()
     deletePlayers()
@@ -220,7 +1066,7 @@ def testLargeTournament(ties=False):
 
     # Repeats rounds until tournament concluded and False is returned
     while True:
-        if not randomRound(tourney_id, ties):
+        if not randomRound(tourney_id, ties, strategy):
             break
 
     printTournamentStandings(tourney_id)
@@ -308,7 +1154,7 @@ def printTournamentStandings(tourney_id):
         print (output)
 
 
-def randomRound(tourney_id, ties=False):
+def randomRound(tourney_id, ties=False, strategy="random"):
     """If swissPairings returns empty then there are no more possible rounds
        for the tournament. Otherwise will take every player pair and determine
        a winner and loser (or tie if enabled)
@@ -316,23 +1162,26 @@ def randomRound(tourney_id, ties=False):
        Args:
             tourney_id: the unique id of the tournament this match is in
             ties: True allows possible random ties. Default False
+            strategy: swissPairings strategy to use. Default "random"
 
        Returns:
             Boolean: False if no pairs are returned, True after a round
     """
-    pairings = swissPairings(tourney_id)
+    pairings = swissPairings(tourney_id, strategy)
     if pairings == [None]:
         return False
     else:
+        results = []
         for pair in pairings:
 
             # ties is false; no tied matches can occur tie will always be False
             # ties is True; tied matches can randomly occur
             # and will be reflected in variable tie being True
-            [winner, loser, tie] = randomWinner(pair[0], pair[2], ties)
+            results.append(randomWinner(pair[0], pair[2], ties))
 
-            # reportMatch will determine what to do if there is a tied match
-            reportMatch(winner, loser, tourney_id, tie)
+        # reportRound records the whole round at once and will determine
+        # what to do if there is a tied match
+        reportRound(tourney_id, results)
 
         # UNCOMMENT THIS NEXT LINE TO PRINT THE TOURNAMENT ROUNDS LIVE
 ##        printTournamentStandings(tourney_id)
@@ -379,6 +1228,26 @@ if __name__ == '__main__':
     testStandingsBeforeMatches()
     testReportMatches()
     testPairings()
+    testConnectionPool()
+    testStandingsRecords()
+    testReportRound()
+    testRegisterPlayers()
+    testMaxWeightMatching()
+    testMatchingPairings()
+    testPairingsIndex()
+    testTournamentEngine()
+    testAsyncApi()
+    testQueryPlans()
+    testTiebreaks()
+    testRatings()
+    testMemoryBackend()
+    testMonteCarloPairings()
+    testPairingSnapshot()
+    testConcurrentRegistration()
+    testStreamingExport()
+    testMetrics()
+    testPurgeTournaments()
+    testPartitions()
     print ("Success!  All tests pass!")
 
     print ("\nAttempting randomly generated Small Tournament")
@@ -389,6 +1258,10 @@ if __name__ == '__main__':
     testLargeTournament()
     print ("Success!  Large Tournament concluded")
 
+    print ("\nAttempting Large Tournament with matching pairings")
+    testLargeTournament(True, "matching")
+    print ("Success!  Large Tournament concluded")
+
     print ("\nAttempting Small Tournament with random ties")
     testSmallTournament(True)
     print ("Success!  Small Tournament concluded")